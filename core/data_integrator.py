@@ -1,26 +1,59 @@
 import pandas as pd
 import geopandas as gpd
 import pandas as pd
-from utils.file_utils import check_file_exists
+from typing import Iterator, List, Tuple
+from utils.cache_utils import read_with_cache
+from utils.file_utils import check_file_exists, read_columnar, write_columnar
+
+
+# 支持的输入文件类型
+FILE_TYPES = ('shp', 'geojson', 'csv', 'excel', 'parquet', 'feather')
+
+# 字段冲突处理策略
+# keep_first: 保留第一个数据源的字段
+# keep_last: 保留最后一个数据源的字段
+# suffix: 全部保留, 后续数据源的冲突字段重命名为 字段名_数据源序号
+# coalesce: 按数据源顺序取第一个非空值
+# priority: 保留优先级最高的数据源的字段, 优先级相同时保留靠前的数据源
+CONFLICT_POLICIES = ('keep_first', 'keep_last', 'suffix', 'coalesce', 'priority')
 
 
 class DataIntegrator:
-    def __init__(self, tile_id_field: str = 'FID'):
+    def __init__(self, tile_id_field: str = 'FID', lazy: bool = False,
+                 cache_dir: str | None = None, cache_size_mb: float = 1024,
+                 conflict_policy: str = 'keep_first'):
         """初始化，设置区块ID字段名
         
         Args:
             tile_id_field: 区块ID字段名
+            lazy: 是否延迟读取, 为True时 add_data 只记录数据源, 在 merge_data 时才读取所需字段
+            cache_dir: 解析结果缓存目录, 为None时不缓存; shp/geojson/csv/excel 解析后以Parquet缓存,
+                按文件路径、大小与修改时间识别, 文件未变化时直接读取缓存
+            cache_size_mb: 缓存目录的大小上限(MB), 超出时按最近最少使用淘汰
+            conflict_policy: 字段冲突处理策略, 见 CONFLICT_POLICIES
         """
+        if conflict_policy not in CONFLICT_POLICIES:
+            raise ValueError(f"不支持的字段冲突处理策略: {conflict_policy}")
         self.tile_id_field = tile_id_field
+        self.conflict_policy = conflict_policy
+        self.lazy = lazy
+        self.cache_dir = cache_dir
+        self.cache_size_mb = cache_size_mb
         self.dataframes = []
+        self.priorities = []
+        self.sources = []
         self.merged_df = pd.DataFrame()
 
-    def add_data(self, file_path: str, file_type: str) -> bool:
-        """添加数据文件(shp/geojson/csv/excel)
+    def add_data(self, file_path: str, file_type: str, columns: List[str] | None = None,
+                 priority: int = 0) -> bool:
+        """添加数据文件(shp/geojson/csv/excel/parquet/feather)
         
         Args:
             file_path: 数据文件路径
-            file_type: 文件类型 ('shp', 'geojson', 'csv', 'excel')
+            file_type: 文件类型 ('shp', 'geojson', 'csv', 'excel', 'parquet', 'feather')
+                parquet/feather 含地理元数据时读取为GeoDataFrame
+            columns: 只读取的字段, 区块ID字段会自动加入, 为None时读取全部字段
+            priority: 数据源优先级, 冲突处理策略为 priority 时优先保留高优先级数据源的字段
         
         Returns:
             是否添加成功
@@ -29,77 +62,231 @@ class DataIntegrator:
             return False
         
         try:
-            if file_type.lower() == 'shp':
-                df = gpd.read_file(file_path)
-                if df is None:
-                    return False
-            elif file_type.lower() == 'geojson':
-                df = gpd.read_file(file_path)
-            elif file_type.lower() == 'csv':
-                df = pd.read_csv(file_path)
-                if df is None:
-                    return False
-            elif file_type.lower() == 'excel':
-                df = pd.read_excel(file_path)
-            else:
+            if file_type.lower() not in FILE_TYPES:
                 raise Exception(f"不支持的文件类型: {file_type}")
-            
-            # 检查区块ID字段是否存在
-            if self.tile_id_field not in df.columns:
-                raise Exception(f"文件{file_path}中缺少{self.tile_id_field}字段")
+
+            # 延迟模式只记录数据源与字段投影
+            if self.lazy:
+                self.sources.append((file_path, file_type.lower(), columns, priority))
+                return True
+
+            df = self._read_source(file_path, file_type.lower(), columns)
+            if df is None:
+                return False
             
             # 添加到数据框列表
             self.dataframes.append(df)
+            self.priorities.append(priority)
             return True
         except Exception as e:
             raise Exception(f"添加数据文件时出错: {str(e)}")
 
-    def merge_data(self) -> pd.DataFrame:
+    def _read_source(self, file_path: str, file_type: str, columns: List[str] | None = None) -> pd.DataFrame:
+        """读取数据文件, 只读取指定字段并检查区块ID字段
+        
+        Args:
+            file_path: 数据文件路径
+            file_type: 文件类型
+            columns: 只读取的字段, 为None时读取全部字段
+        
+        Returns:
+            数据框
+        """
+        if columns is not None:
+            columns = [self.tile_id_field] + [c for c in columns if c != self.tile_id_field]
+
+        if self.cache_dir is not None and file_type not in ('parquet', 'feather'):
+            # 缓存完整的解析结果, 字段投影在读取缓存时进行; 矢量文件的几何列总会被读取
+            if columns is not None and file_type in ('shp', 'geojson'):
+                columns = columns + ['geometry']
+            df = read_with_cache(
+                file_path,
+                lambda: self._parse_source(file_path, file_type),
+                self.cache_dir, columns, self.cache_size_mb
+            )
+        else:
+            df = self._parse_source(file_path, file_type, columns)
+        
+        # 检查区块ID字段是否存在
+        if self.tile_id_field not in df.columns:
+            raise Exception(f"文件{file_path}中缺少{self.tile_id_field}字段")
+        return df
+
+    def _parse_source(self, file_path: str, file_type: str, columns: List[str] | None = None) -> pd.DataFrame:
+        """解析数据文件
+        
+        Args:
+            file_path: 数据文件路径
+            file_type: 文件类型
+            columns: 只读取的字段, 为None时读取全部字段
+        
+        Returns:
+            数据框
+        """
+        if file_type in ('shp', 'geojson'):
+            # 矢量文件的几何列总会被读取
+            df = gpd.read_file(file_path, columns=columns)
+        elif file_type == 'csv':
+            df = pd.read_csv(file_path, usecols=columns)
+        elif file_type == 'excel':
+            df = pd.read_excel(file_path, usecols=columns)
+        else:
+            df = read_columnar(file_path, file_type, columns)
+        return df
+
+    def _iter_dataframes(self) -> Iterator[Tuple[pd.DataFrame, int]]:
+        """依次获取各数据源的数据框与优先级, 延迟模式下逐个读取"""
+        if not self.lazy:
+            yield from zip(self.dataframes, self.priorities)
+            return
+        for file_path, file_type, columns, priority in self.sources:
+            try:
+                yield self._read_source(file_path, file_type, columns), priority
+            except Exception as e:
+                raise Exception(f"读取数据文件{file_path}时出错: {str(e)}")
+
+    def merge_data(self, conflict_policy: str | None = None) -> pd.DataFrame:
         """合并所有数据，处理字段冲突
         
+        先按冲突处理策略整块确定每个数据源保留或重命名的字段, 再以区块ID字段为索引,
+        一次性按索引做多路内连接; 若某个数据源的区块ID不唯一, 则退回逐个 pd.merge.
+        字段顺序为各字段第一次出现的顺序, geometry字段总是保留第一个数据源的
+        
+        Args:
+            conflict_policy: 字段冲突处理策略, 为None时使用初始化时设置的策略
+        
         Returns:
             合并后的数据框
         """
-        if not self.dataframes:
+        policy = self.conflict_policy if conflict_policy is None else conflict_policy
+        if policy not in CONFLICT_POLICIES:
+            raise ValueError(f"不支持的字段冲突处理策略: {policy}")
+
+        frames = []
+        priorities = []
+        for df, priority in self._iter_dataframes():
+            frames.append(df)
+            priorities.append(priority)
+
+        if not frames:
             return pd.DataFrame()
-        
-        # 从第一个数据框开始合并
-        merged_df = self.dataframes[0].copy()
-        
-        # 合并剩余的数据框
-        for df in self.dataframes[1:]:
-            merged_df = self._resolve_column_conflicts(merged_df, df)
+
+        first = frames[0]
+        frames, coalesce_blocks, layout = self._resolve_column_conflicts(frames, priorities, policy)
+
+        if all(df[self.tile_id_field].is_unique for df in frames):
+            merged_df = self._join_frames(frames)
+        else:
+            # 从第一个数据框开始合并
+            merged_df = frames[0].copy()
+            
+            # 合并剩余的数据框
+            for df in frames[1:]:
+                merged_df = pd.merge(merged_df, df, on=self.tile_id_field)
+
+        # 按数据源顺序整块填充空值
+        for columns, renamed in coalesce_blocks:
+            merged_df[columns] = merged_df[columns].fillna(merged_df[renamed].set_axis(columns, axis=1))
+
+        if list(merged_df.columns) != layout:
+            merged_df = merged_df[layout]
+
+        if isinstance(first, gpd.GeoDataFrame) and not isinstance(merged_df, gpd.GeoDataFrame):
+            merged_df = gpd.GeoDataFrame(merged_df, geometry=first.geometry.name, crs=first.crs)
 
         self.merged_df = merged_df
         
         return merged_df
 
-    def _resolve_column_conflicts(self, df1: pd.DataFrame, df2: pd.DataFrame) -> pd.DataFrame:
-        """处理字段冲突
+    def _join_frames(self, frames: List[pd.DataFrame]) -> pd.DataFrame:
+        """以区块ID为索引一次性多路内连接, 结果的行顺序与字段顺序与逐个 pd.merge 一致
         
         Args:
-            df1: 第一个数据框
-            df2: 第二个数据框
+            frames: 区块ID唯一且字段互不冲突的数据框列表
         
         Returns:
             合并后的数据框
         """
-        common_cols = set(df1.columns) & set(df2.columns)
-        common_cols.discard(self.tile_id_field)
+        first = frames[0]
+        indexed = [df.set_index(self.tile_id_field) for df in frames]
+        merged_df = pd.concat(indexed, axis=1, join='inner')
+
+        # 按第一个数据框的区块ID顺序排列, 并将区块ID字段放回原位置
+        keys = first[self.tile_id_field]
+        merged_df = merged_df.reindex(keys[keys.isin(merged_df.index)].values)
+        merged_df = merged_df.reset_index()
+        columns = list(merged_df.columns[1:])
+        columns.insert(first.columns.get_loc(self.tile_id_field), self.tile_id_field)
+        return merged_df[columns]
+
+    def _resolve_column_conflicts(self, frames: List[pd.DataFrame], priorities: List[int],
+                                  policy: str) -> Tuple[List[pd.DataFrame], List[Tuple[List[str], List[str]]], List[str]]:
+        """处理字段冲突
         
-        for col in common_cols:
-            # 简单策略：保留第一个数据源的字段
-            df2 = df2.drop(columns=[col])
-            # print(f"检测到重复列{col}，已从第二个数据集中移除")
+        先统计每个字段出现在哪些数据源中, 再对每个数据源一次性删除或重命名冲突字段,
+        不逐字段复制数据框
         
-        return pd.merge(df1, df2, on=self.tile_id_field)
+        Args:
+            frames: 各数据源的数据框
+            priorities: 各数据源的优先级
+            policy: 字段冲突处理策略
+        
+        Returns:
+            (处理后的数据框列表, [(待填充字段, 对应的临时字段)], 合并结果的字段顺序)
+        """
+        owners = {}
+        for i, df in enumerate(frames):
+            for col in df.columns:
+                owners.setdefault(col, []).append(i)
+
+        resolved = []
+        coalesce_blocks = []
+        layout = list(owners)
+
+        if policy in ('keep_first', 'keep_last', 'priority'):
+            # 每个字段只保留一个数据源的, 各数据源一次性删除不保留的字段
+            if policy == 'keep_last':
+                owner = {c: sources[-1] for c, sources in owners.items()}
+            elif policy == 'priority':
+                owner = {c: max(sources, key=lambda j: (priorities[j], -j)) for c, sources in owners.items()}
+            else:
+                owner = {c: sources[0] for c, sources in owners.items()}
+            if 'geometry' in owners:
+                owner['geometry'] = owners['geometry'][0]
+            for i, df in enumerate(frames):
+                drop = [c for c in df.columns if c != self.tile_id_field and owner[c] != i]
+                resolved.append(df.drop(columns=drop) if drop else df)
+            return resolved, coalesce_blocks, layout
+
+        for i, df in enumerate(frames):
+            # 重复出现的geometry字段直接删除, 其余冲突字段整块重命名
+            drop = [c for c in df.columns if c == 'geometry' and owners[c][0] != i]
+            conflict_columns = [c for c in df.columns
+                                if c not in (self.tile_id_field, 'geometry') and owners[c][0] != i]
+            if policy == 'suffix':
+                renamed = [f"{c}_{i}" for c in conflict_columns]
+            else:
+                renamed = [f"__coalesce_{i}__{c}" for c in conflict_columns]
+                if conflict_columns:
+                    coalesce_blocks.append((conflict_columns, renamed))
+            if drop:
+                df = df.drop(columns=drop)
+            if conflict_columns:
+                df = df.rename(columns=dict(zip(conflict_columns, renamed)))
+            resolved.append(df)
+
+        if policy == 'suffix':
+            # 重命名的字段排在所属数据源的字段之后
+            layout = list(dict.fromkeys(c for df in resolved for c in df.columns))
+        return resolved, coalesce_blocks, layout
 
     def export_data(self, output_path: str, output_type: str) -> bool:
         """导出数据到指定格式
         
         Args:
             output_path: 输出文件路径
-            output_type: 输出类型 ('csv', 'json', 'excel', 'shp)
+            output_type: 输出类型 ('csv', 'json', 'excel', 'shp', 'parquet', 'feather')
+                parquet/feather 为列式压缩存储, 保留完整字段名; 有geometry列时写为GeoParquet/GeoArrow
         
         Returns:
             是否导出成功
@@ -129,6 +316,8 @@ class DataIntegrator:
             elif output_type.lower() == 'shp':
                 gdf = gpd.GeoDataFrame(merged_df, geometry='geometry')
                 gdf.to_file(output_path, driver='ESRI Shapefile')
+            elif output_type.lower() in ('parquet', 'feather'):
+                write_columnar(merged_df, output_path, output_type.lower())
             else:
                 raise Exception(f"不支持的输出类型: {output_type}")
             
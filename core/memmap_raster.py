@@ -0,0 +1,124 @@
+import os
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+from utils.cache_utils import source_fingerprint
+from utils.file_utils import create_dir_if_not_exists
+from utils.raster_utils import iter_row_strips
+
+
+class MemmapRaster:
+    def __init__(self, src: rasterio.DatasetReader, array_path: str):
+        """以内存映射的 .npy 文件读取像素的底图, 元数据(坐标系、仿射变换、尺寸等)仍取自原底图
+
+        按窗口读取只是对映射数组切片后复制, 不经过GDAL的逐次调用开销与分块解码,
+        重复读取同一块田时速度受页缓存限制; 未实现的属性与方法转交给原底图
+
+        Args:
+            src: 原底图数据集
+            array_path: 由 convert_to_memmap 生成的 (波段, 行, 列) .npy 文件路径
+        """
+        self.src = src
+        self.array_path = array_path
+        self.array = np.load(array_path, mmap_mode='r')
+        if self.array.shape != (src.count, src.height, src.width):
+            raise ValueError(f"内存映射文件{array_path}与底图{src.name}的尺寸不一致")
+
+    @classmethod
+    def open(cls, path: str, cache_dir: str | None = None, memory_budget_mb: float = 512) -> 'MemmapRaster':
+        """打开底图, 首次使用时转换为内存映射文件
+
+        Args:
+            path: 底图文件路径
+            cache_dir: 内存映射文件目录, 为None时使用底图同目录下的 .memmap
+            memory_budget_mb: 转换时单个条带的内存预算(MB)
+
+        Returns:
+            内存映射底图
+        """
+        array_path = convert_to_memmap(path, cache_dir, memory_budget_mb)
+        src = rasterio.open(path)
+        try:
+            return cls(src, array_path)
+        except Exception:
+            src.close()
+            raise
+
+    def read(self, indexes=None, window: Window | None = None, **kwargs) -> np.ndarray:
+        """按窗口读取像素, 与 DatasetReader.read 的返回值一致
+
+        Args:
+            indexes: 波段序号(从1开始)或其列表, 为None时读取所有波段
+            window: 整数像素窗口, 为None时读取全图
+            **kwargs: 其它参数(如 out_shape、masked), 有时交给原底图读取
+
+        Returns:
+            (波段, 行, 列)数组, indexes为整数时为(行, 列)数组
+        """
+        if kwargs:
+            return self.src.read(indexes, window=window, **kwargs)
+
+        if window is None:
+            rows = cols = slice(None)
+        else:
+            row_off, col_off = int(round(window.row_off)), int(round(window.col_off))
+            rows = slice(max(row_off, 0), max(row_off + int(round(window.height)), 0))
+            cols = slice(max(col_off, 0), max(col_off + int(round(window.width)), 0))
+
+        if indexes is None:
+            return np.array(self.array[:, rows, cols])
+        if isinstance(indexes, int):
+            return np.array(self.array[indexes - 1, rows, cols])
+        return np.array(self.array[[i - 1 for i in indexes], rows, cols])
+
+    def close(self) -> None:
+        """关闭原底图并释放内存映射"""
+        self.src.close()
+        self.array = None
+
+    def __getattr__(self, name):
+        return getattr(self.src, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def convert_to_memmap(path: str, cache_dir: str | None = None, memory_budget_mb: float = 512) -> str:
+    """将底图按条带转换为未压缩的 (波段, 行, 列) .npy 文件, 已转换且底图未变化时直接复用
+
+    文件名为底图指纹(路径、大小与修改时间), 底图被修改后会重新转换
+
+    Args:
+        path: 底图文件路径
+        cache_dir: 输出目录, 为None时使用底图同目录下的 .memmap
+        memory_budget_mb: 单个条带的内存预算(MB)
+
+    Returns:
+        .npy 文件路径
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), '.memmap')
+    array_path = os.path.join(cache_dir, f"{source_fingerprint(path)}.npy")
+    if os.path.exists(array_path):
+        return array_path
+
+    create_dir_if_not_exists(cache_dir)
+    tmp_path = f"{array_path}.{os.getpid()}.tmp"
+    try:
+        with rasterio.open(path) as src:
+            array = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=src.dtypes[0],
+                                              shape=(src.count, src.height, src.width))
+            row_bytes = src.count * src.width * np.dtype(src.dtypes[0]).itemsize
+            for start, stop in iter_row_strips(src.height, row_bytes, memory_budget_mb):
+                array[:, start:stop] = src.read(window=Window(0, start, src.width, stop - start))
+            array.flush()
+            del array
+        os.replace(tmp_path, array_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return array_path
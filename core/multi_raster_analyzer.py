@@ -1,22 +1,51 @@
 import rasterio
 import geopandas as gpd
+import hashlib
 import numpy as np
 import os
+import pandas as pd
 import rasterio
+import shapely
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from typing import List, Dict, Tuple, Iterator
-from rasterio.features import geometry_mask
-from rasterio.windows import from_bounds
-from utils.file_utils import check_file_exists, create_dir_if_not_exists
+from rasterio.features import geometry_mask, rasterize
+from rasterio.windows import Window, from_bounds
+from core.memmap_raster import MemmapRaster
+from utils.index_utils import channel_name
+from utils.file_utils import check_file_exists, create_dir_if_not_exists, get_columnar_format, read_columnar, write_columnar
+
+
+# 区块像素提取方式: 区块外置0 / 掩膜数组 / 只保留区块内像素
+EXTRACT_MODES = ('zero', 'masked', 'compact')
+
+# 区块读取计划: 逐区块读取 / 按行条带合并读取
+READ_PLANS = ('tile', 'strip')
+
+# 底图读取后端: 通过GDAL按窗口读取 / 转换为内存映射的 .npy 后直接切片
+RASTER_BACKENDS = ('rasterio', 'memmap')
 
 
 class MultiRasterAnalyzer:
-    def __init__(self, shp_path: str, raster_paths: List[Tuple[str, str]]):
+    def __init__(self, shp_path: str, raster_paths: List[Tuple[str, str]],
+                 index_cache_dir: str | None = None, use_index_cache: bool = True,
+                 backend: str = 'rasterio', memmap_dir: str | None = None):
         """初始化，加载shp和底图，执行重合性校验
         
         Args:
-            shp_path: 区块边界shp文件路径
+            shp_path: 区块边界shp文件路径, 也可以是GeoParquet/GeoFeather文件
             raster_paths: 底图文件路径列表
+            index_cache_dir: 区块像素索引的缓存目录, 为None时使用shp文件同目录下的 .plot_index
+            use_index_cache: 是否读写区块像素索引缓存, 为False时每次重新栅格化区块
+            backend: 底图读取后端
+                'rasterio': 通过GDAL按窗口读取
+                'memmap': 首次使用时将底图转换为未压缩的 .npy 文件并内存映射,
+                          区块读取为数组切片, 适合对同一块田反复计算不同指数或统计量
+            memmap_dir: backend为'memmap'时 .npy 文件的目录, 为None时使用底图同目录下的 .memmap
         """
+        if backend not in RASTER_BACKENDS:
+            raise ValueError(f"底图读取后端必须是{'/'.join(RASTER_BACKENDS)}之一")
+
         # 检查文件是否存在
         if not check_file_exists(shp_path):
             raise FileNotFoundError(f"shp文件不存在: {shp_path}")
@@ -26,25 +55,23 @@ class MultiRasterAnalyzer:
                 raise FileNotFoundError(f"底图文件不存在: {path}")
         
         # 加载shp文件
-        try:
-            self.tiles = gpd.read_file(shp_path)
-            self.crs = self.tiles.crs
-        except Exception as e:
-            raise IOError(f"无法打开shp文件: {str(e)}")
-        
-        # 验证区块ID字段是否存在
-        if 'FID' not in self.tiles.columns:
-            raise ValueError("shp文件中缺少FID字段")
+        self.tiles = read_plot_layout(shp_path)
+        self.crs = self.tiles.crs
+        self.index_cache_dir = default_index_cache_dir(shp_path) if index_cache_dir is None else index_cache_dir
+        self.use_index_cache = use_index_cache
+        self._plot_index = None
         
         # 加载底图
         self.raster_paths = raster_paths
+        self.backend = backend
+        self.memmap_dir = memmap_dir
         self.rasters = {}
         
         try:
             for name, path in raster_paths:
                 
                 # 打开底图并存储
-                src = rasterio.open(path)
+                src = _open_raster(path, backend, memmap_dir)
                 self.rasters[name] = src
                 
                 # 检查CRS是否一致
@@ -63,6 +90,18 @@ class MultiRasterAnalyzer:
                 src.close()
             raise ValueError("底图不完全重合")
 
+    @property
+    def plot_index(self) -> 'PlotMaskIndex':
+        """区块像素索引, 所有底图网格一致, 首次使用时从缓存读取或构建"""
+        if self._plot_index is None:
+            reference = next(iter(self.rasters.values()))
+            tile_geoms = self.tiles.geometry.values
+            if self.use_index_cache:
+                self._plot_index = PlotMaskIndex.load_or_build(tile_geoms, reference, self.index_cache_dir)
+            else:
+                self._plot_index = PlotMaskIndex.build(tile_geoms, reference.transform, reference.height, reference.width)
+        return self._plot_index
+
     def validate_overlap(self) -> bool:
         """验证所有底图与shp文件是否完全重合
         
@@ -93,134 +132,848 @@ class MultiRasterAnalyzer:
     
     
 
-    def iterate_tiles(self) -> Iterator[Tuple[np.int64, Dict[str, np.ndarray]]]:
+    def iterate_tiles(self, workers: int = 1, chunk_size: int | None = None,
+                      ordered: bool = True, mode: str = 'zero', plan: str = 'tile',
+                      strip_rows: int = 1024) -> Iterator[Tuple[np.int64, Dict[str, np.ndarray]]]:
         """遍历所有区块，返回(区块ID, {底图名: 像素数组})
         
+        Args:
+            workers: 并行进程数, 大于1时将区块分块后交给进程池提取, 每个进程持有自己的底图句柄
+            chunk_size: 每个任务包含的区块数, 为None时按进程数自动划分; plan为'strip'时每个条带为一个任务
+            ordered: 并行时是否保持区块顺序, 为False时按完成先后返回
+            mode: 像素提取方式, 见 _extract_tile_without_resampling
+            plan: 读取计划
+                'tile': 逐区块读取窗口, 按tiles中的顺序返回
+                'strip': 将相邻区块按底图内部分块所在的行条带分组, 每个条带只读取一次,
+                         再从内存中切出各区块像素, 按条带自上而下的顺序返回
+            strip_rows: plan为'strip'时条带的最大行数, 会对齐到底图内部分块高度
+        
         Yields:
             (区块ID, {底图名: 像素数组})
         """
-        for idx, row in self.tiles.iterrows():
-            tile_id = row['FID']
-            tile_geom = row['geometry']
-            
-            # 获取每个底图的像素数据
-            tile_data = {}
-            for name, src in self.rasters.items():
-                data = self._extract_tile_without_resampling(src, tile_geom)
-                tile_data[name] = data
-            
-            yield tile_id, tile_data
+        if mode not in EXTRACT_MODES:
+            raise ValueError(f"像素提取方式必须是{'/'.join(EXTRACT_MODES)}之一")
+        if plan not in READ_PLANS:
+            raise ValueError(f"读取计划必须是{'/'.join(READ_PLANS)}之一")
 
-    def _extract_tile_without_resampling(self, raster: rasterio.DatasetReader, tile_geom) -> np.ndarray:
+        tile_ids = self.tiles['FID'].values
+        plot_index = self.plot_index
+        if plan == 'strip':
+            chunks = [
+                (tile_ids[members], plot_index.subset(members), mode, strip)
+                for strip, members in self._plan_strip_reads(strip_rows)
+            ]
+        else:
+            if chunk_size is None:
+                chunk_size = max(1, int(np.ceil(len(tile_ids) / (workers * 4))))
+            chunks = [
+                (tile_ids[i:i + chunk_size], plot_index.subset(np.arange(i, min(i + chunk_size, len(tile_ids)))), mode)
+                for i in range(0, len(tile_ids), chunk_size)
+            ]
+
+        if workers > 1:
+            yield from self._iterate_tiles_parallel(workers, chunks, ordered)
+            return
+
+        for chunk in chunks:
+            yield from _extract_tiles(self.rasters, *chunk)
+
+    def _iterate_tiles_parallel(self, workers: int, chunks: List[tuple],
+                                ordered: bool) -> Iterator[Tuple[np.int64, Dict[str, np.ndarray]]]:
+        """使用进程池并行提取区块像素
+        
+        Args:
+            workers: 并行进程数
+            chunks: 任务参数列表, 每项为 _extract_tiles 除底图句柄外的参数
+            ordered: 是否保持任务顺序
+        
+        Yields:
+            (区块ID, {底图名: 像素数组})
+        """
+        # 限制同时在途的任务数, 避免结果堆积占用内存
+        max_pending = workers * 2
+
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_tile_worker,
+                                 initargs=(self.raster_paths, self.backend, self.memmap_dir)) as executor:
+            if ordered:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(executor.submit(_extract_tiles_chunk, *chunk))
+                    if len(pending) >= max_pending:
+                        yield from pending.popleft().result()
+                while pending:
+                    yield from pending.popleft().result()
+            else:
+                pending = set()
+                for chunk in chunks:
+                    pending.add(executor.submit(_extract_tiles_chunk, *chunk))
+                    if len(pending) >= max_pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield from future.result()
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+
+    def _plan_strip_reads(self, strip_rows: int) -> List[Tuple[Window, np.ndarray]]:
+        """按底图内部分块所在的行条带对区块分组
+
+        区块按窗口起始行排序后贪心合并, 条带上下边界对齐到分块边界,
+        使每个压缩分块在一次遍历中只被解码一次
+
+        Args:
+            strip_rows: 条带的最大行数, 会对齐到底图内部分块高度
+
+        Returns:
+            [(条带窗口, 区块在tiles中的位置数组)]
+        """
+        reference = next(iter(self.rasters.values()))
+        block_height, block_width = reference.block_shapes[0]
+        strip_rows = max(block_height, strip_rows // block_height * block_height)
+        plot_index = self.plot_index
+        windows = [plot_index.window(i) for i in range(len(plot_index))]
+        order = sorted(range(len(windows)), key=lambda i: (windows[i].row_off, windows[i].col_off))
+
+        groups = []
+        members = []
+        group_start = group_stop = 0
+        for i in order:
+            window = windows[i]
+            start = window.row_off // block_height * block_height
+            stop = min(-(-(window.row_off + window.height) // block_height) * block_height, reference.height)
+            if members and max(group_stop, stop) - group_start <= strip_rows:
+                members.append(i)
+                group_stop = max(group_stop, stop)
+            else:
+                if members:
+                    groups.append((group_start, group_stop, members))
+                members = [i]
+                group_start, group_stop = start, stop
+        if members:
+            groups.append((group_start, group_stop, members))
+
+        plans = []
+        for group_start, group_stop, members in groups:
+            col_start = min(windows[i].col_off for i in members) // block_width * block_width
+            col_stop = max(windows[i].col_off + windows[i].width for i in members)
+            col_stop = min(-(-col_stop // block_width) * block_width, reference.width)
+            strip = Window(col_start, group_start, max(col_stop - col_start, 0), max(group_stop - group_start, 0))
+            plans.append((strip, np.array(members)))
+        return plans
+
+    @staticmethod
+    def _tile_window(raster: rasterio.DatasetReader, tile_geom) -> Window:
+        """获取区块边界框对齐到像素网格的窗口
+
+        窗口向外取整到整像素并裁剪到底图范围内, 保证读取的像素与掩膜的地理位置严格对应,
+        从条带中切出的区块像素与单独读取完全一致
+
+        Args:
+            raster: 底图数据集
+            tile_geom: 区块几何形状
+
+        Returns:
+            整数像素窗口
+        """
+        return _grid_window(tile_geom, raster.transform, raster.height, raster.width)
+
+    @staticmethod
+    def _apply_tile_mask(data: np.ndarray, mask: np.ndarray, mode: str, copy: bool = False) -> np.ndarray:
+        """按像素提取方式应用区块掩膜
+
+        Args:
+            data: (波段, 行, 列)像素数组
+            mask: 区块内为True的掩膜
+            mode: 像素提取方式
+            copy: data为共享缓冲区的视图时需复制后再置0
+
+        Returns:
+            区块像素数据
+        """
+        if mode == 'masked':
+            # 每个波段一份可写的掩膜, 调用方可以继续用 arr[arr > x] = np.ma.masked 掩膜无效值;
+            # 从条带切出时复制数据, 区块不再引用整个条带缓冲区, 条带用完即可释放
+            return np.ma.MaskedArray(data, mask=np.repeat(~mask[None], data.shape[0], axis=0), copy=copy)
+        if mode == 'compact':
+            return data[:, mask]
+
+        # 原地置0, 不再额外分配一份数组
+        if copy:
+            data = data.copy()
+        data[:, ~mask] = 0
+        return data
+
+    @staticmethod
+    def _extract_tile_without_resampling(raster: rasterio.DatasetReader, tile_geom, mode: str = 'zero') -> np.ndarray:
         """无重采样提取区块像素
         
         Args:
             raster: 底图数据集
             tile_geom: 区块几何形状
+            mode: 像素提取方式
+                'zero': 返回(波段, 行, 列)数组, 区块外像素置0
+                'masked': 返回(波段, 行, 列)的 numpy.ma.MaskedArray, 区块外像素被掩膜
+                'compact': 返回(波段, 像素数)数组, 只包含区块内像素
         
         Returns:
             区块像素数据
         """
-        # 获取区块边界框的像素范围
-        minx, miny, maxx, maxy = tile_geom.bounds
-        window = from_bounds(minx, miny, maxx, maxy, raster.transform)
+        window = MultiRasterAnalyzer._tile_window(raster, tile_geom)
         
         # 读取原始像素数据
         data = raster.read(window=window)
         
         # 创建与区块几何形状匹配的掩膜
-        mask = geometry_mask(
-            [tile_geom],
-            out_shape=data.shape[1:],
-            transform=raster.window_transform(window),
-            invert=True
-        )
+        mask = _tile_mask(tile_geom, data.shape[1:], raster.window_transform(window))
         
-        return data * mask
+        return MultiRasterAnalyzer._apply_tile_mask(data, mask, mode)
+
+    def zonal_statistics(self, strip_rows: int = 1024) -> List[Dict]:
+        """基于区块标签栅格的向量化分区统计
+
+        将所有区块一次性栅格化为与底图对齐的整数标签栅格, 按行条带顺序读取底图,
+        用 np.bincount 一次性累加每个区块每个波段的像素数、和、平方和、最小值与最大值,
+        代替逐区块的窗口读取与掩膜构建. 区块重叠时重叠像素只归属于靠后的区块.
 
-    def export_results_to_shapefile(self, result_data: List[Dict], output_path: str) -> bool:
+        Args:
+            strip_rows: 每次读取的条带行数, 会对齐到底图内部分块高度
+
+        Returns:
+            结果数据，字典数组，每个字典格式为
+            {'FID': 区块ID, 'cnt_波段': 像素数, 'sum_波段': 和, 'ssq_波段': 平方和,
+             'min_波段': 最小值, 'max_波段': 最大值, 'avg_波段': 均值, 'std_波段': 标准差}
+            多波段底图的波段名与指数公式一致, 为 底图名_通道, 如 rgb_r/rgb_g/rgb_b
+        """
+        num_tiles = len(self.tiles)
+        band_names = self._band_names()
+
+        # 标签0为背景, 区块标签为其在tiles中的位置+1
+        shape = (len(band_names), num_tiles + 1)
+        counts = np.zeros(shape, dtype=np.int64)
+        sums = np.zeros(shape, dtype=np.float64)
+        sqsums = np.zeros(shape, dtype=np.float64)
+        mins = np.full(shape, np.inf, dtype=np.float64)
+        maxs = np.full(shape, -np.inf, dtype=np.float64)
+
+        reference = next(iter(self.rasters.values()))
+        for strip, labels in self._iterate_label_strips(reference, strip_rows):
+            inside = labels > 0
+            if not inside.any():
+                continue
+            strip_labels = labels[inside]
+
+            band_index = 0
+            for src in self.rasters.values():
+                data = src.read(window=strip)
+                for band in data:
+                    values = band[inside].astype(np.float64)
+                    valid = ~np.isnan(values)
+                    lab = strip_labels[valid]
+                    values = values[valid]
+
+                    counts[band_index] += np.bincount(lab, minlength=num_tiles + 1)
+                    sums[band_index] += np.bincount(lab, weights=values, minlength=num_tiles + 1)
+                    sqsums[band_index] += np.bincount(lab, weights=values * values, minlength=num_tiles + 1)
+                    np.minimum.at(mins[band_index], lab, values)
+                    np.maximum.at(maxs[band_index], lab, values)
+                    band_index += 1
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = sums / counts
+            stds = np.sqrt(np.maximum(sqsums / counts - means * means, 0))
+        empty = counts == 0
+        mins[empty] = np.nan
+        maxs[empty] = np.nan
+
+        results = []
+        for i, fid in enumerate(self.tiles['FID'].values, start=1):
+            result = {'FID': fid}
+            for b, name in enumerate(band_names):
+                result[f"cnt_{name}"] = int(counts[b, i])
+                result[f"sum_{name}"] = sums[b, i]
+                result[f"ssq_{name}"] = sqsums[b, i]
+                result[f"min_{name}"] = mins[b, i]
+                result[f"max_{name}"] = maxs[b, i]
+                result[f"avg_{name}"] = means[b, i]
+                result[f"std_{name}"] = stds[b, i]
+            results.append(result)
+        return results
+
+    def extract_labeled_pixels(self, strip_rows: int = 1024) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+        """按标签栅格提取所有区块内的像素, 拼接为一维数组
+
+        各波段像素顺序一致, 可逐像素计算指数后直接交给 stats_utils.compute_batch_stats
+
+        Args:
+            strip_rows: 每次读取的条带行数, 会对齐到底图内部分块高度
+
+        Returns:
+            (区块ID数组, 每个像素所属的区块ID, {波段名: 像素数组})
+            多波段底图的波段名与指数公式一致, 为 底图名_通道, 如 rgb_r/rgb_g/rgb_b
+        """
+        fids = self.tiles['FID'].values
+        band_names = self._band_names()
+        labels = []
+        pixels = {name: [] for name in band_names}
+
+        reference = next(iter(self.rasters.values()))
+        for strip, strip_labels in self._iterate_label_strips(reference, strip_rows):
+            inside = strip_labels > 0
+            if not inside.any():
+                continue
+            labels.append(fids[strip_labels[inside] - 1])
+
+            band_index = 0
+            for src in self.rasters.values():
+                data = src.read(window=strip)
+                for band in data:
+                    pixels[band_names[band_index]].append(band[inside])
+                    band_index += 1
+
+        if not labels:
+            return fids, np.array([], dtype=fids.dtype), {name: np.array([]) for name in band_names}
+        return fids, np.concatenate(labels), {name: np.concatenate(values) for name, values in pixels.items()}
+
+    def _band_names(self) -> List[str]:
+        """获取所有底图展开后的波段名
+
+        Returns:
+            波段名列表, 单波段底图使用底图名, 多波段底图为 底图名_通道 (见 utils/index_utils.py 中的 channel_name),
+            可直接传给 evaluate_indices
+        """
+        band_names = []
+        for name, src in self.rasters.items():
+            if src.count == 1:
+                band_names.append(name)
+            else:
+                band_names.extend(channel_name(name, b) for b in range(src.count))
+        return band_names
+
+    def _iterate_label_strips(self, raster: rasterio.DatasetReader, strip_rows: int) -> Iterator[Tuple[Window, np.ndarray]]:
+        """按行条带生成区块标签栅格
+
+        Args:
+            raster: 用于对齐的底图数据集
+            strip_rows: 每个条带的行数, 会对齐到底图内部分块高度
+
+        Yields:
+            (条带窗口, 条带标签数组) 标签0为背景, 其余为区块在tiles中的位置+1
+        """
+        # 只处理覆盖所有区块的范围
+        extent = from_bounds(*self.tiles.total_bounds, raster.transform)
+        row_start = max(int(np.floor(extent.row_off)), 0)
+        row_stop = min(int(np.ceil(extent.row_off + extent.height)), raster.height)
+        col_start = max(int(np.floor(extent.col_off)), 0)
+        col_stop = min(int(np.ceil(extent.col_off + extent.width)), raster.width)
+        if row_start >= row_stop or col_start >= col_stop:
+            return
+
+        block_height = raster.block_shapes[0][0]
+        strip_rows = max(block_height, strip_rows // block_height * block_height)
+
+        # 预先计算每个区块覆盖的行范围, 每个条带只栅格化与其相交的区块
+        geoms = self.tiles.geometry.values
+        bounds = self.tiles.bounds
+        inv = ~raster.transform
+        _, top_rows = inv * (bounds['minx'].values, bounds['maxy'].values)
+        _, bottom_rows = inv * (bounds['minx'].values, bounds['miny'].values)
+        tile_row_min = np.minimum(top_rows, bottom_rows)
+        tile_row_max = np.maximum(top_rows, bottom_rows)
+
+        strip_start = row_start // block_height * block_height
+        for r in range(strip_start, row_stop, strip_rows):
+            r0 = max(r, row_start)
+            r1 = min(r + strip_rows, row_stop)
+            strip = Window(col_start, r0, col_stop - col_start, r1 - r0)
+
+            hits = np.nonzero((tile_row_max >= r0) & (tile_row_min <= r1))[0]
+            if len(hits) == 0:
+                continue
+
+            labels = rasterize(
+                ((geoms[i], i + 1) for i in hits),
+                out_shape=(r1 - r0, col_stop - col_start),
+                transform=raster.window_transform(strip),
+                fill=0,
+                dtype='int32'
+            )
+            yield strip, labels
+
+    def export_results_to_shapefile(self, result_data, output_path: str) -> bool:
         """将分析结果导出到shapefile
         
+        同一FID出现多次时, 各字段取最后一个非空值, 空值不会覆盖同一FID之前的结果
+        (不同来源的结果列表拼接后可以各自只含部分字段)
+        
         Args:
-            result_data: 结果数据，字典数组，每个字典格式为{'FID': 数字, '自定义字段': 值}
+            result_data: 结果数据，字典数组，每个字典格式为{'FID': 数字, '自定义字段': 值};
+                也可以是含FID列的DataFrame或Arrow表
             output_path: 输出shapefile路径
         
         Returns:
             是否导出成功
         """
         try:
-            # 创建输出目录（如果不存在）
-            output_dir = os.path.dirname(output_path)
-            if output_dir and not os.path.exists(output_dir):
-                create_dir_if_not_exists(output_dir)
-                
-            # 创建一个原始数据的副本
-            output_gdf = self.tiles.copy()
-            
-            # 处理结果数据
-            for item in result_data:
-                fid = item['FID']
-                
-                if fid is None:
-                    continue
-                
-                # 检查FID是否存在
-                if fid not in output_gdf['FID'].values:
-                    continue
-                
-                # 添加或更新字段
-                for key, value in item.items():
-                    if key != 'FID':
-                        output_gdf.loc[output_gdf['FID'] == fid, key] = value
-            
-            # 保存到shapefile
-            output_gdf.to_file(output_path)
-            return True
+            return self._export_results(result_data, output_path)
         except Exception as e:
             raise Exception(f"导出结果到shapefile时出错: {str(e)}")
 
-    def export_results_to_geojson(self, result_data: List[Dict], output_path: str) -> bool:
+    def export_results_to_geojson(self, result_data, output_path: str) -> bool:
         """将分析结果导出到geojson
         
+        同一FID出现多次时, 各字段取最后一个非空值, 空值不会覆盖同一FID之前的结果
+        (不同来源的结果列表拼接后可以各自只含部分字段)
+        
         Args:
-            result_data: 结果数据，字典数组，每个字典格式为{'FID': 数字, '自定义字段': 值}
+            result_data: 结果数据，字典数组，每个字典格式为{'FID': 数字, '自定义字段': 值};
+                也可以是含FID列的DataFrame或Arrow表
             output_path: 输出geojson路径
         
         Returns:
             是否导出成功
         """
         try:
-            # 创建输出目录（如果不存在）
-            output_dir = os.path.dirname(output_path)
-            if output_dir and not os.path.exists(output_dir):
-                create_dir_if_not_exists(output_dir)
-                
-            # 创建一个原始数据的副本
-            output_gdf = self.tiles.copy()
-            
-            # 处理结果数据
-            for item in result_data:
-                fid = item['FID']
-                
-                if fid is None:
-                    continue
-                
-                # 检查FID是否存在
-                if fid not in output_gdf['FID'].values:
-                    continue
-                
-                # 添加或更新字段
-                for key, value in item.items():
-                    if key != 'FID':
-                        output_gdf.loc[output_gdf['FID'] == fid, key] = value
-            
-            # 保存到geojson
-            output_gdf.to_file(output_path, driver='GeoJSON')
-            return True
+            return self._export_results(result_data, output_path, driver='GeoJSON')
         except Exception as e:
             raise Exception(f"导出结果到geojson时出错: {str(e)}")
 
+    def export_results_to_parquet(self, result_data, output_path: str) -> bool:
+        """将分析结果导出到GeoParquet, 列式压缩存储且保留完整字段名
+        
+        同一FID出现多次时, 各字段取最后一个非空值, 空值不会覆盖同一FID之前的结果
+        (不同来源的结果列表拼接后可以各自只含部分字段)
+        
+        Args:
+            result_data: 结果数据，字典数组、含FID列的DataFrame或Arrow表
+            output_path: 输出parquet路径
+        
+        Returns:
+            是否导出成功
+        """
+        try:
+            return self._export_results(result_data, output_path, driver='parquet')
+        except Exception as e:
+            raise Exception(f"导出结果到parquet时出错: {str(e)}")
+
+    def export_results_to_feather(self, result_data, output_path: str) -> bool:
+        """将分析结果导出到Feather(GeoArrow), 列式压缩存储且保留完整字段名
+        
+        同一FID出现多次时, 各字段取最后一个非空值, 空值不会覆盖同一FID之前的结果
+        (不同来源的结果列表拼接后可以各自只含部分字段)
+        
+        Args:
+            result_data: 结果数据，字典数组、含FID列的DataFrame或Arrow表
+            output_path: 输出feather路径
+        
+        Returns:
+            是否导出成功
+        """
+        try:
+            return self._export_results(result_data, output_path, driver='feather')
+        except Exception as e:
+            raise Exception(f"导出结果到feather时出错: {str(e)}")
+
+    def _export_results(self, result_data, output_path: str, driver: str | None = None) -> bool:
+        """按FID合并结果并写出文件, 各导出格式共用, driver 为 'parquet'/'feather' 时写出列式存储"""
+        # 创建输出目录（如果不存在）
+        output_dir = os.path.dirname(output_path)
+        if output_dir and not os.path.exists(output_dir):
+            create_dir_if_not_exists(output_dir)
+
+        output_gdf = self._merge_results(result_data)
+        if driver in ('parquet', 'feather'):
+            write_columnar(output_gdf, output_path, driver)
+        elif driver is None:
+            output_gdf.to_file(output_path)
+        else:
+            output_gdf.to_file(output_path, driver=driver)
+        return True
+
+    def _merge_results(self, result_data) -> gpd.GeoDataFrame:
+        """按FID将结果合并到区块数据的副本中
+        
+        结果先整理为以FID为索引的表, 再一次性按区块的FID对齐, 复杂度与区块数和结果数成线性关系.
+        FID为空或不在区块中的结果被忽略; 同一FID出现多次时, 各字段取最后一个非空值
+        
+        Args:
+            result_data: 结果数据，字典数组、含FID列的DataFrame或Arrow表
+        
+        Returns:
+            合并结果后的GeoDataFrame
+        """
+        output_gdf = self.tiles.copy()
+
+        results = _results_to_frame(result_data)
+        if 'FID' not in results.columns:
+            if len(results) == 0:
+                return output_gdf
+            raise ValueError("结果数据中缺少FID字段")
+        results = results[results['FID'].notna()]
+        results = results.drop(columns=[c for c in results.columns if c == 'geometry'])
+        results = results.groupby('FID', sort=False).last()
+        if len(results.columns) == 0:
+            return output_gdf
+
+        # 按区块的FID对齐结果, 没有结果的区块为NaN
+        aligned = results.reindex(output_gdf['FID'].values)
+        aligned.index = output_gdf.index
+
+        # 新字段整列赋值, 已有字段只更新有结果的区块
+        new_columns = [c for c in aligned.columns if c not in output_gdf.columns]
+        existing_columns = [c for c in aligned.columns if c in output_gdf.columns]
+        if new_columns:
+            output_gdf[new_columns] = aligned[new_columns]
+        if existing_columns:
+            matched = output_gdf['FID'].isin(results.index).values
+            output_gdf.loc[matched, existing_columns] = aligned.loc[matched, existing_columns]
+        return output_gdf
+
     def __del__(self):
         """析构函数，关闭所有打开的底图"""
         for src in self.rasters.values():
-            src.close()
\ No newline at end of file
+            src.close()
+
+
+def read_plot_layout(shp_path: str) -> gpd.GeoDataFrame:
+    """读取区块边界, 支持shp与GeoParquet/GeoFeather文件, 并校验FID字段
+
+    Args:
+        shp_path: 区块边界文件路径
+
+    Returns:
+        区块表
+    """
+    try:
+        columnar_format = get_columnar_format(shp_path)
+        if columnar_format is not None:
+            tiles = read_columnar(shp_path, columnar_format)
+            if not isinstance(tiles, gpd.GeoDataFrame):
+                raise ValueError("文件中缺少地理元数据")
+        else:
+            tiles = gpd.read_file(shp_path)
+    except Exception as e:
+        raise IOError(f"无法打开shp文件: {str(e)}")
+
+    # 验证区块ID字段是否存在
+    if 'FID' not in tiles.columns:
+        raise ValueError("shp文件中缺少FID字段")
+    return tiles
+
+
+class PlotMaskIndex:
+    def __init__(self, windows: np.ndarray, offsets: np.ndarray, pixels: np.ndarray):
+        """区块到像素的索引, 只依赖区块几何形状与底图网格, 同一网格的所有底图与日期可共用
+
+        Args:
+            windows: (区块数, 4)数组, 每行为区块窗口的 (起始列, 起始行, 宽, 高)
+            offsets: (区块数 + 1)数组, 第i个区块的像素为 pixels[offsets[i]:offsets[i + 1]]
+            pixels: 区块内像素在各自窗口中按行展开的位置
+        """
+        self.windows = windows
+        self.offsets = offsets
+        self.pixels = pixels
+
+    @classmethod
+    def build(cls, tile_geoms, transform, height: int, width: int) -> 'PlotMaskIndex':
+        """为一个底图网格构建区块像素索引, 每个区块只生成一次掩膜
+
+        Args:
+            tile_geoms: 区块几何形状数组
+            transform: 底图的仿射变换
+            height: 底图行数
+            width: 底图列数
+
+        Returns:
+            区块像素索引
+        """
+        windows = np.zeros((len(tile_geoms), 4), dtype=np.int64)
+        offsets = np.zeros(len(tile_geoms) + 1, dtype=np.int64)
+        pixels = []
+        for i, tile_geom in enumerate(tile_geoms):
+            window = _grid_window(tile_geom, transform, height, width)
+            windows[i] = (window.col_off, window.row_off, window.width, window.height)
+            mask = _tile_mask(tile_geom, (window.height, window.width), rasterio.windows.transform(window, transform))
+            flat = np.flatnonzero(mask).astype(np.int32)
+            pixels.append(flat)
+            offsets[i + 1] = offsets[i] + len(flat)
+        pixels = np.concatenate(pixels) if pixels else np.zeros(0, dtype=np.int32)
+        return cls(windows, offsets, pixels)
+
+    @classmethod
+    def load_or_build(cls, tile_geoms, raster: rasterio.DatasetReader, cache_dir: str) -> 'PlotMaskIndex':
+        """从磁盘缓存读取区块像素索引, 未命中时构建并写入缓存
+
+        缓存以区块几何形状与底图网格(坐标系、仿射变换与尺寸)的哈希为键,
+        同一网格的其它波段与之后的运行都直接读取, 无需重新栅格化; 缓存目录不可写时只构建不缓存
+
+        Args:
+            tile_geoms: 区块几何形状数组
+            raster: 底图数据集, 只使用其网格
+            cache_dir: 缓存目录
+
+        Returns:
+            区块像素索引
+        """
+        key = plot_index_key(tile_geoms, raster.crs, raster.transform, raster.height, raster.width)
+        cache_path = os.path.join(cache_dir, f"{key}.npz")
+        if os.path.exists(cache_path):
+            try:
+                return cls.load(cache_path)
+            except (OSError, ValueError, KeyError):
+                pass
+
+        plot_index = cls.build(tile_geoms, raster.transform, raster.height, raster.width)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            plot_index.save(cache_path)
+        except OSError:
+            pass
+        return plot_index
+
+    @classmethod
+    def load(cls, path: str) -> 'PlotMaskIndex':
+        """读取 save 保存的区块像素索引"""
+        with np.load(path) as npz:
+            return cls(npz['windows'], npz['offsets'], npz['pixels'])
+
+    def save(self, path: str) -> None:
+        """将区块像素索引保存为 .npz 文件, 先写临时文件再替换, 并发运行时不会读到不完整的文件"""
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        try:
+            np.savez(tmp_path, windows=self.windows, offsets=self.offsets, pixels=self.pixels)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def subset(self, positions: np.ndarray) -> 'PlotMaskIndex':
+        """获取部分区块的索引, 用于把一组区块交给工作进程时只传递所需的部分
+
+        Args:
+            positions: 区块在区块表中的位置数组
+
+        Returns:
+            按 positions 顺序排列的区块像素索引
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        starts = self.offsets[positions]
+        stops = self.offsets[positions + 1]
+        offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(stops - starts, out=offsets[1:])
+        if len(positions):
+            pixels = np.concatenate([self.pixels[start:stop] for start, stop in zip(starts, stops)])
+        else:
+            pixels = self.pixels[:0]
+        return PlotMaskIndex(self.windows[positions], offsets, pixels)
+
+    def __len__(self) -> int:
+        return len(self.windows)
+
+    def window(self, i: int) -> Window:
+        """获取第i个区块的窗口"""
+        col_off, row_off, width, height = self.windows[i]
+        return Window(int(col_off), int(row_off), int(width), int(height))
+
+    def mask(self, i: int) -> np.ndarray:
+        """获取第i个区块的掩膜, 区块内为True"""
+        _, _, width, height = self.windows[i]
+        mask = np.zeros(int(height) * int(width), dtype=bool)
+        mask[self.pixels[self.offsets[i]:self.offsets[i + 1]]] = True
+        return mask.reshape(int(height), int(width))
+
+    def extract(self, raster: rasterio.DatasetReader, i: int) -> np.ndarray:
+        """读取第i个区块的区块内像素, 与 compact 提取方式的结果一致
+
+        Args:
+            raster: 与索引网格一致的底图数据集
+            i: 区块在区块表中的位置
+
+        Returns:
+            (波段, 像素数)数组
+        """
+        data = raster.read(window=self.window(i))
+        return data.reshape(data.shape[0], -1)[:, self.pixels[self.offsets[i]:self.offsets[i + 1]]]
+
+
+# 进程池工作进程持有的底图句柄
+_worker_rasters: Dict[str, rasterio.DatasetReader] = {}
+
+
+def _init_tile_worker(raster_paths: List[Tuple[str, str]], backend: str = 'rasterio',
+                      memmap_dir: str | None = None):
+    """进程池工作进程初始化，打开本进程的底图句柄
+    
+    Args:
+        raster_paths: 底图文件路径列表
+        backend: 底图读取后端, memmap后端的 .npy 文件已由主进程生成, 各进程映射同一文件
+        memmap_dir: .npy 文件目录
+    """
+    for name, path in raster_paths:
+        _worker_rasters[name] = _open_raster(path, backend, memmap_dir)
+
+
+def _open_raster(path: str, backend: str = 'rasterio', memmap_dir: str | None = None):
+    """按读取后端打开底图"""
+    if backend == 'memmap':
+        return MemmapRaster.open(path, memmap_dir)
+    return rasterio.open(path)
+
+
+def _extract_tiles_chunk(tile_ids: np.ndarray, plot_index: 'PlotMaskIndex', mode: str = 'zero',
+                         strip: Window | None = None) -> List[Tuple[np.int64, Dict[str, np.ndarray]]]:
+    """在工作进程中提取一组区块的像素, 参数见 _extract_tiles
+    
+    Returns:
+        [(区块ID, {底图名: 像素数组})]
+    """
+    return list(_extract_tiles(_worker_rasters, tile_ids, plot_index, mode, strip))
+
+
+def _extract_tiles(rasters: Dict[str, rasterio.DatasetReader], tile_ids: np.ndarray, plot_index: 'PlotMaskIndex',
+                   mode: str = 'zero', strip: Window | None = None) -> Iterator[Tuple[np.int64, Dict[str, np.ndarray]]]:
+    """提取一组区块的像素, 所有底图网格一致, 每个区块的窗口与掩膜取自区块像素索引, 不再栅格化
+    
+    Args:
+        rasters: {底图名: 底图数据集}
+        tile_ids: 区块ID数组
+        plot_index: 与 tile_ids 一一对应的区块像素索引
+        mode: 像素提取方式
+        strip: 条带窗口, 为None时逐区块读取, 否则每个底图只读取一次条带再切出各区块
+    
+    Yields:
+        (区块ID, {底图名: 像素数组})
+    """
+    if strip is None:
+        for i, tile_id in enumerate(tile_ids):
+            window = plot_index.window(i)
+            mask = plot_index.mask(i)
+            tile_data = {}
+            for name, src in rasters.items():
+                tile_data[name] = MultiRasterAnalyzer._apply_tile_mask(src.read(window=window), mask, mode)
+            yield tile_id, tile_data
+        return
+
+    strip_data = {name: src.read(window=strip) for name, src in rasters.items()}
+    for i, tile_id in enumerate(tile_ids):
+        window = plot_index.window(i)
+        row = max(window.row_off - strip.row_off, 0)
+        col = max(window.col_off - strip.col_off, 0)
+        rows = slice(row, row + window.height)
+        cols = slice(col, col + window.width)
+
+        mask = plot_index.mask(i)
+        tile_data = {}
+        for name, data in strip_data.items():
+            tile_data[name] = MultiRasterAnalyzer._apply_tile_mask(data[:, rows, cols], mask, mode, copy=True)
+        yield tile_id, tile_data
+
+
+def merge_tile_streams(streams: List[Iterator[Tuple[np.int64, Dict[str, np.ndarray]]]]) -> Iterator[Tuple[np.int64, Dict[str, np.ndarray]]]:
+    """按FID流式合并多个分析器的区块流, 如多光谱与RGB
+    
+    轮流从各个流中取一个区块, 某个区块在所有流中都到达后立即合并返回并释放;
+    各流顺序一致时同时缓存的区块不超过一个, 顺序不一致(如条带读取计划或无序并行)时只缓存尚未配齐的区块.
+    同一FID出现多次时按出现次序一一对应
+    
+    Args:
+        streams: 区块流列表, 每项为 iterate_tiles 的返回值
+    
+    Yields:
+        (区块ID, {底图名: 像素数组})
+    """
+    if len(streams) == 1:
+        yield from streams[0]
+        return
+
+    iterators = [iter(stream) for stream in streams]
+    occurrences = [{} for _ in streams]
+    pending = {}
+    active = list(range(len(iterators)))
+    while active:
+        for k in list(active):
+            item = next(iterators[k], None)
+            if item is None:
+                active.remove(k)
+                continue
+            tile_id, tile_data = item
+            occurrence = occurrences[k].get(tile_id, 0)
+            occurrences[k][tile_id] = occurrence + 1
+
+            key = (tile_id, occurrence)
+            arrived, merged = pending.get(key, (0, {}))
+            merged.update(tile_data)
+            if arrived + 1 == len(iterators):
+                pending.pop(key, None)
+                yield tile_id, merged
+            else:
+                pending[key] = (arrived + 1, merged)
+
+    if pending:
+        missing = ', '.join(str(tile_id) for tile_id, _ in list(pending)[:10])
+        raise ValueError(f"以下区块没有出现在所有底图中: {missing}")
+
+
+def default_index_cache_dir(shp_path: str) -> str:
+    """区块像素索引的默认缓存目录, 位于区块边界文件同目录下"""
+    return os.path.join(os.path.dirname(os.path.abspath(shp_path)), '.plot_index')
+
+
+def plot_index_key(tile_geoms, crs, transform, height: int, width: int) -> str:
+    """计算区块像素索引的缓存键, 由区块几何形状的WKB与底图网格(坐标系、仿射变换与尺寸)的哈希组成
+
+    Args:
+        tile_geoms: 区块几何形状数组
+        crs: 底图坐标系
+        transform: 底图的仿射变换
+        height: 底图行数
+        width: 底图列数
+
+    Returns:
+        哈希字符串
+    """
+    digest = hashlib.sha1()
+    digest.update(f"{crs}|{tuple(transform)}|{height}|{width}\n".encode('utf-8'))
+    for wkb in shapely.to_wkb(np.asarray(tile_geoms)):
+        # 空几何形状的WKB为None
+        wkb = wkb or b''
+        digest.update(len(wkb).to_bytes(8, 'little'))
+        digest.update(wkb)
+    return digest.hexdigest()
+
+
+def _grid_window(tile_geom, transform, height: int, width: int) -> Window:
+    """获取区块边界框在底图网格中向外取整并裁剪到底图范围内的整数像素窗口"""
+    minx, miny, maxx, maxy = tile_geom.bounds
+    window = from_bounds(minx, miny, maxx, maxy, transform)
+    row_start = max(int(np.floor(window.row_off)), 0)
+    col_start = max(int(np.floor(window.col_off)), 0)
+    row_stop = min(int(np.ceil(window.row_off + window.height)), height)
+    col_stop = min(int(np.ceil(window.col_off + window.width)), width)
+    return Window(col_start, row_start, max(col_stop - col_start, 0), max(row_stop - row_start, 0))
+
+
+def _tile_mask(tile_geom, shape: Tuple[int, int], transform) -> np.ndarray:
+    """创建区块掩膜
+    
+    Args:
+        tile_geom: 区块几何形状
+        shape: 窗口形状(行, 列)
+        transform: 窗口的仿射变换
+    
+    Returns:
+        区块内为True的布尔数组
+    """
+    if shape[0] == 0 or shape[1] == 0:
+        return np.zeros(shape, dtype=bool)
+    return geometry_mask([tile_geom], out_shape=shape, transform=transform, invert=True)
+
+
+def _results_to_frame(result_data) -> pd.DataFrame:
+    """将结果数据统一转换为DataFrame, 支持字典数组、DataFrame与带 to_pandas 方法的表(如Arrow表)"""
+    if isinstance(result_data, pd.DataFrame):
+        return result_data
+    if hasattr(result_data, 'to_pandas'):
+        return result_data.to_pandas()
+    return pd.DataFrame(list(result_data))
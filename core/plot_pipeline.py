@@ -0,0 +1,255 @@
+import os
+import numpy as np
+from abc import ABC, abstractmethod
+import rasterio
+from typing import Callable, Dict, Iterator, List, Tuple
+from core.multi_raster_analyzer import MultiRasterAnalyzer, merge_tile_streams
+from utils.file_utils import create_dir_if_not_exists
+from utils.image_writer import ImageWriter
+from utils.index_utils import evaluate_indices, required_rasters
+from utils.stats_utils import compute_all_stats
+
+
+class PlotTile:
+    def __init__(self, tile_id, data: Dict[str, np.ma.MaskedArray]):
+        """单个区块在各底图中的像素, 由流水线读取一次后交给所有步骤共享
+
+        Args:
+            tile_id: 区块ID
+            data: {底图名: (波段, 行, 列)的掩膜数组}, 区块外像素被掩膜
+        """
+        self.tile_id = tile_id
+        self.data = data
+        self._compact = {}
+
+    def mask(self, name: str) -> np.ndarray:
+        """获取区块掩膜, 区块内为True"""
+        return ~np.ma.getmaskarray(self.data[name])[0]
+
+    def zero(self, name: str) -> np.ndarray:
+        """获取(波段, 行, 列)数组, 区块外像素置0"""
+        return np.ma.filled(self.data[name], 0)
+
+    def compact(self, name: str) -> np.ndarray:
+        """获取(波段, 像素数)数组, 只包含区块内像素, 结果会被缓存供其它步骤复用"""
+        if name not in self._compact:
+            self._compact[name] = np.ma.getdata(self.data[name])[:, self.mask(name)]
+        return self._compact[name]
+
+    def compact_bands(self, names: List[str]) -> Dict[str, np.ndarray]:
+        """获取多个底图的区块内像素"""
+        return {name: self.compact(name) for name in names}
+
+
+class PlotStage(ABC):
+    def __init__(self, name: str, bands: List[str]):
+        """流水线步骤, 声明所需的底图, 逐区块处理
+
+        Args:
+            name: 步骤名
+            bands: 所需的底图名列表
+        """
+        self.name = name
+        self.bands = list(bands)
+
+    @abstractmethod
+    def process(self, tile: PlotTile) -> None:
+        """处理单个区块"""
+
+    def finish(self):
+        """所有区块处理完成后调用, 返回步骤结果"""
+        return None
+
+
+class CutStage(PlotStage):
+    def __init__(self, output_dir: str, file_name: str, band: str = 'rgb', name: str = 'cut',
+                 writer: ImageWriter | None = None):
+        """按区块切割RGB图像并保存为PNG, 区块外与黑色像素透明
+
+        Args:
+            output_dir: 输出目录, 每个区块保存为 output_dir/区块ID/file_name.png
+            file_name: 文件名(不含扩展名)
+            band: RGB底图名
+            name: 步骤名
+            writer: 后台图像写出器, 为None时使用自己的写出器并在 finish 时等待写出完成
+        """
+        super().__init__(name, [band])
+        self.output_dir = output_dir
+        self.file_name = file_name
+        self.band = band
+        self.writer = writer
+        self._own_writer = writer is None
+        self.outputs = []
+
+    def process(self, tile: PlotTile) -> None:
+        # 构建输出文件路径
+        tile_dir = os.path.join(self.output_dir, str(tile.tile_id))
+        create_dir_if_not_exists(tile_dir)
+        output_path = os.path.join(tile_dir, f"{self.file_name}.png")
+
+        if self.writer is None:
+            self.writer = ImageWriter()
+
+        # 数据已经是uint8类型，值范围在0-255之间，不需要归一化
+        # 编码与写出在后台线程中进行, 区块外与黑色像素透明
+        self.writer.submit_png(output_path, tile.zero(self.band), tile.mask(self.band))
+        self.outputs.append(output_path)
+
+    def finish(self) -> List[str]:
+        """等待写出完成, 返回所有输出文件路径"""
+        if self._own_writer and self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        return self.outputs
+
+
+class IndexStage(PlotStage):
+    def __init__(self, index_names: List[str],
+                 summarize: Callable[[Dict[str, np.ndarray]], Dict] | None = None,
+                 name: str = 'index', **evaluate_kwargs):
+        """逐区块计算植被指数并汇总为标量结果, 不保留像素数据
+
+        Args:
+            index_names: 指数名列表, 见 utils/index_utils.py 中的 INDEX_EXPRESSIONS
+            summarize: 将 {指数名: 像素数组} 汇总为 {字段名: 值} 的函数, 为None时计算各指数的均值
+            name: 步骤名
+            **evaluate_kwargs: 传给 evaluate_indices 的参数, 如 nan/posinf/neginf
+        """
+        super().__init__(name, required_rasters(index_names))
+        self.index_names = list(index_names)
+        self.summarize = summarize if summarize is not None else lambda indexs: compute_all_stats(indexs, stats=['mean'])
+        self.evaluate_kwargs = evaluate_kwargs
+        self.results = []
+
+    def process(self, tile: PlotTile) -> None:
+        indexs = evaluate_indices(tile.compact_bands(self.bands), self.index_names, **self.evaluate_kwargs)
+        self.results.append({'FID': tile.tile_id, **self.summarize(indexs)})
+
+    def finish(self) -> List[Dict]:
+        """返回所有区块的结果"""
+        return self.results
+
+
+class PlotPipeline:
+    def __init__(self, shp_path: str, raster_paths: List[Tuple[str, str]], stages: List[PlotStage]):
+        """区块流水线, 每个区块在每个底图中只读取一次, 再依次交给所有步骤
+
+        只打开步骤声明需要的底图; 网格(坐标系、仿射变换与尺寸)相同的底图由同一个分析器读取,
+        不同网格(如高分辨率RGB与多光谱)的区块流按FID流式合并, 内存中只保留尚未配齐的区块
+
+        Args:
+            shp_path: 区块边界shp文件路径
+            raster_paths: 底图文件路径列表
+            stages: 步骤列表
+        """
+        self.stages = stages
+        required = {band for stage in stages for band in stage.bands}
+        available = {name for name, _ in raster_paths}
+        missing = required - available
+        if missing:
+            raise ValueError(f"缺少步骤所需的底图: {', '.join(sorted(missing))}")
+
+        # 按网格分组
+        groups = {}
+        for name, path in raster_paths:
+            if name not in required:
+                continue
+            with rasterio.open(path) as src:
+                key = (str(src.crs), tuple(src.transform), src.shape)
+            groups.setdefault(key, []).append((name, path))
+
+        self.analyzers = []
+        try:
+            for group in groups.values():
+                self.analyzers.append(MultiRasterAnalyzer(shp_path, group))
+        except Exception:
+            self.close()
+            raise
+
+    def iterate_tiles(self, workers: int = 1, plan: str = 'tile', ordered: bool = True,
+                      strip_rows: int = 1024, memory_budget_mb: float | None = None) -> Iterator[PlotTile]:
+        """遍历各网格的分析器并按FID合并, 每个区块返回一次包含所有底图像素的 PlotTile
+
+        Args:
+            workers: 每个分析器的并行进程数
+            plan: 读取计划, 见 MultiRasterAnalyzer.iterate_tiles
+            ordered: 并行时是否保持区块顺序
+            strip_rows: plan为'strip'时条带的最大行数
+            memory_budget_mb: plan为'strip'时所有网格的条带缓冲区合计的内存预算(MB),
+                不为None时按各网格的行字节数计算条带行数, 代替 strip_rows
+
+        Yields:
+            PlotTile
+        """
+        streams = [
+            analyzer.iterate_tiles(workers=workers, mode='masked', plan=plan, ordered=ordered,
+                                   strip_rows=self._strip_rows(analyzer, strip_rows, memory_budget_mb))
+            for analyzer in self.analyzers
+        ]
+        for tile_id, data in merge_tile_streams(streams):
+            yield PlotTile(tile_id, data)
+
+    def run(self, workers: int = 1, plan: str = 'tile', ordered: bool = True,
+            strip_rows: int = 1024, memory_budget_mb: float | None = None) -> Dict[str, object]:
+        """运行流水线, 每个区块处理完即释放像素数据, 峰值内存与单个区块(及尚未配齐的区块)成正比;
+        plan为'strip'时另加每个网格一个条带缓冲区, 由 strip_rows 或 memory_budget_mb 限制
+
+        Args:
+            workers: 每个分析器的并行进程数
+            plan: 读取计划, 见 MultiRasterAnalyzer.iterate_tiles
+            ordered: 并行时是否保持区块顺序, 结果按FID合并, 不要求有序
+            strip_rows: plan为'strip'时条带的最大行数
+            memory_budget_mb: plan为'strip'时条带缓冲区合计的内存预算(MB), 见 iterate_tiles
+
+        Returns:
+            {步骤名: 步骤结果}
+        """
+        try:
+            if self.analyzers:
+                for tile in self.iterate_tiles(workers, plan, ordered, strip_rows, memory_budget_mb):
+                    for stage in self.stages:
+                        stage.process(tile)
+        except BaseException:
+            # 出错时也要结束所有步骤, 关闭后台写出器; 抛出原始错误, 结束时的错误不再覆盖它
+            try:
+                self._finish_stages()
+            except Exception:
+                pass
+            raise
+        return self._finish_stages()
+
+    def _finish_stages(self) -> Dict[str, object]:
+        """依次结束所有步骤, 某个步骤出错时仍结束其余步骤, 最后抛出第一个错误"""
+        results = {}
+        error = None
+        for stage in self.stages:
+            try:
+                results[stage.name] = stage.finish()
+            except Exception as e:
+                if error is None:
+                    error = e
+        if error is not None:
+            raise error
+        return results
+
+    def _strip_rows(self, analyzer: MultiRasterAnalyzer, strip_rows: int, memory_budget_mb: float | None) -> int:
+        """计算分析器的条带行数, 有内存预算时由各网格平分预算
+
+        条带至少为底图内部分块的高度, 预算小于一个分块行时以分块行为准
+        """
+        if memory_budget_mb is None:
+            return strip_rows
+        row_bytes = sum(src.count * src.width * np.dtype(src.dtypes[0]).itemsize for src in analyzer.rasters.values())
+        budget = memory_budget_mb * 1024 * 1024 / len(self.analyzers)
+        return max(1, int(budget // max(row_bytes, 1)))
+
+    def export_results_to_geojson(self, result_data, output_path: str) -> bool:
+        """将分析结果按FID合并到区块并导出到geojson"""
+        return self.analyzers[0].export_results_to_geojson(result_data, output_path)
+
+    def close(self):
+        """关闭所有打开的底图"""
+        for analyzer in self.analyzers:
+            for src in analyzer.rasters.values():
+                src.close()
+        self.analyzers = []
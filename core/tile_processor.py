@@ -1,5 +1,6 @@
 import rasterio
 import geopandas as gpd
+import shapely
 from shapely.geometry import Polygon
 from typing import Tuple, List
 from utils.file_utils import check_file_exists, create_dir_if_not_exists
@@ -62,8 +63,6 @@ class TileProcessor:
         if geo_coords is None and shape is None:
             raise ValueError("必须提供geo_coords或shape参数")
         
-        tiles = []
-
         # 从shape中获取顶点坐标
         if shape is not None:
             if not shape.is_valid:
@@ -98,46 +97,49 @@ class TileProcessor:
         # 生成均匀网格点
         x = np.linspace(0, 1, m + 1)
         y = np.linspace(0, 1, n + 1)
-            
-        for i in range(m):
-            for j in range(n):
-                # 在归一化空间中计算区块边界
-                left = x[i]
-                right = x[i + 1]
-                bottom = y[j]
-                top = y[j + 1]
-                    
-                # 缩小区块
-                width = right - left
-                height = top - bottom
-                left += width * (1 - shrink_ratio[0]) / 2
-                right -= width * (1 - shrink_ratio[0]) / 2
-                bottom += height * (1 - shrink_ratio[1]) / 2
-                top -= height * (1 - shrink_ratio[1]) / 2
-                
-                # 生成归一化空间中的矩形顶点
-                norm_rect = np.array([[left, bottom], [right, bottom], [right, top], [left, top]])                    
-                # 应用逆单应性变换，将归一化坐标转换回地理坐标
-                geo_rect = denormalize_coordinates(norm_rect, H)
-                
-                # 创建多边形
-                polygon = Polygon(geo_rect)
 
-                current_id = 0
-                    
-                # 根据顺序生成ID
-                if id_order == 'bottom-right':
-                    # 从右下角开始编号
-                    current_id = start_id + m * n - (j * m + i)
-                else:
-                    # 从左上角开始编号
-                    current_id = start_id + j * m + i + 1
-                    
-                tiles.append({
-                    'FID': current_id,
-                    'geometry': polygon
-                })
-        
+        # 在归一化空间中计算所有区块边界并缩小, 按 (i, j) 展开, i为外层
+        left = np.repeat(x[:-1], n)
+        right = np.repeat(x[1:], n)
+        bottom = np.tile(y[:-1], m)
+        top = np.tile(y[1:], m)
+
+        width = right - left
+        height = top - bottom
+        left = left + width * (1 - shrink_ratio[0]) / 2
+        right = right - width * (1 - shrink_ratio[0]) / 2
+        bottom = bottom + height * (1 - shrink_ratio[1]) / 2
+        top = top - height * (1 - shrink_ratio[1]) / 2
+
+        # 生成归一化空间中所有矩形的顶点, 形状为 (区块数, 4, 2)
+        norm_rects = np.stack([
+            np.column_stack((left, bottom)),
+            np.column_stack((right, bottom)),
+            np.column_stack((right, top)),
+            np.column_stack((left, top)),
+        ], axis=1)
+
+        # 一次性应用逆单应性变换, 将归一化坐标转换回地理坐标
+        geo_rects = denormalize_coordinates(norm_rects.reshape(-1, 2), H).reshape(-1, 4, 2)
+
+        # 批量创建多边形
+        polygons = shapely.polygons(geo_rects)
+
+        # 根据顺序生成ID
+        i = np.repeat(np.arange(m), n)
+        j = np.tile(np.arange(n), m)
+        if id_order == 'bottom-right':
+            # 从右下角开始编号
+            ids = start_id + m * n - (j * m + i)
+        else:
+            # 从左上角开始编号
+            ids = start_id + j * m + i + 1
+
+        tiles = {
+            'FID': ids,
+            'geometry': polygons
+        }
+
         # 创建GeoDataFrame
         gdf = gpd.GeoDataFrame(tiles, crs=self.crs)
         return gdf
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+import rasterio
+from typing import Callable, Dict, List, Tuple
+from core.multi_raster_analyzer import PlotMaskIndex, default_index_cache_dir, read_plot_layout
+from utils.file_utils import check_file_exists
+from utils.index_utils import evaluate_indices, required_rasters
+
+
+class TimeSeriesAnalyzer:
+    def __init__(self, shp_path: str, dated_rasters: Dict[str, List[Tuple[str, str]]],
+                 index_cache_dir: str | None = None, use_index_cache: bool = True):
+        """多时相分析器, 一套区块边界对应多个日期的底图
+
+        区块到像素的索引只与底图网格(坐标系、仿射变换与尺寸)有关,
+        每个不同的网格只构建一次, 由所有使用该网格的底图与日期共用
+
+        Args:
+            shp_path: 区块边界shp文件路径, 也可以是GeoParquet/GeoFeather文件
+            dated_rasters: {日期: 底图文件路径列表}, 如 {'06161': [('red', 'red.tif'), ...]}
+            index_cache_dir: 区块像素索引的缓存目录, 为None时使用shp文件同目录下的 .plot_index
+            use_index_cache: 是否读写区块像素索引缓存
+        """
+        if not check_file_exists(shp_path):
+            raise FileNotFoundError(f"shp文件不存在: {shp_path}")
+
+        for raster_paths in dated_rasters.values():
+            for name, path in raster_paths:
+                if not check_file_exists(path):
+                    raise FileNotFoundError(f"底图文件不存在: {path}")
+
+        self.tiles = read_plot_layout(shp_path)
+        self.crs = self.tiles.crs
+        self.dates = list(dated_rasters)
+        self.dated_rasters = {date: list(raster_paths) for date, raster_paths in dated_rasters.items()}
+
+        self.index_cache_dir = default_index_cache_dir(shp_path) if index_cache_dir is None else index_cache_dir
+        self.use_index_cache = use_index_cache
+
+        # {网格: 区块像素索引}
+        self._plot_indexes = {}
+
+    def plot_index(self, raster: rasterio.DatasetReader) -> PlotMaskIndex:
+        """获取底图所在网格的区块像素索引, 同一网格只构建或从缓存读取一次
+
+        Args:
+            raster: 底图数据集
+
+        Returns:
+            区块像素索引
+        """
+        key = _grid_key(raster)
+        if key not in self._plot_indexes:
+            tile_geoms = self.tiles.geometry.values
+            if self.use_index_cache:
+                self._plot_indexes[key] = PlotMaskIndex.load_or_build(tile_geoms, raster, self.index_cache_dir)
+            else:
+                self._plot_indexes[key] = PlotMaskIndex.build(tile_geoms, raster.transform, raster.height, raster.width)
+        return self._plot_indexes[key]
+
+    def extract_cube(self, index_names: List[str], reducer: Callable[[np.ndarray], float] = np.nanmean,
+                     **evaluate_kwargs) -> Dict[str, object]:
+        """计算每个区块在每个日期的植被指数, 汇总为 (区块, 日期, 指数) 数组
+
+        某日期缺少指数所需的底图, 或区块与底图没有重叠时, 对应的值为NaN
+
+        Args:
+            index_names: 指数名列表, 见 utils/index_utils.py 中的 INDEX_EXPRESSIONS
+            reducer: 将区块内的指数像素汇总为标量的函数
+            **evaluate_kwargs: 传给 evaluate_indices 的参数, 如 nan/posinf/neginf
+
+        Returns:
+            {'values': (区块数, 日期数, 指数数)数组, 'FID': 区块ID, 'dates': 日期列表, 'indices': 指数名列表}
+        """
+        index_names = list(index_names)
+        values = np.full((len(self.tiles), len(self.dates), len(index_names)), np.nan)
+
+        for d, date in enumerate(self.dates):
+            paths = dict(self.dated_rasters[date])
+            available = [name for name in index_names if set(required_rasters([name])) <= set(paths)]
+            if not available:
+                continue
+
+            rasters = {}
+            try:
+                for name in required_rasters(available):
+                    src = rasterio.open(paths[name])
+                    rasters[name] = src
+                    if src.crs != self.crs:
+                        raise ValueError(f"底图{paths[name]}的坐标系统与shp文件不一致")
+
+                # 按底图网格分组, 同组的指数共用区块像素索引与读取的像素
+                groups = {}
+                for name in available:
+                    keys = {_grid_key(rasters[band]) for band in required_rasters([name])}
+                    if len(keys) > 1:
+                        raise ValueError(f"日期{date}中指数{name}所需的底图不完全重合")
+                    groups.setdefault(keys.pop(), []).append(name)
+
+                for group in groups.values():
+                    bands = required_rasters(group)
+                    plot_index = self.plot_index(rasters[bands[0]])
+                    columns = [index_names.index(name) for name in group]
+                    for i in range(len(plot_index)):
+                        pixels = {band: plot_index.extract(rasters[band], i) for band in bands}
+                        if pixels[bands[0]].shape[1] == 0:
+                            continue
+                        indexs = evaluate_indices(pixels, group, **evaluate_kwargs)
+                        values[i, d, columns] = [reducer(indexs[name]) for name in group]
+            finally:
+                for src in rasters.values():
+                    src.close()
+
+        return {
+            'values': values,
+            'FID': self.tiles['FID'].values,
+            'dates': list(self.dates),
+            'indices': index_names,
+        }
+
+
+def cube_to_dataframe(cube: Dict[str, object]) -> pd.DataFrame:
+    """将 (区块, 日期, 指数) 数组转换为每行一个区块与日期的数据框, 便于拟合生长曲线或导出
+
+    Args:
+        cube: extract_cube 的返回值
+
+    Returns:
+        含 FID、date 与各指数列的数据框
+    """
+    values = cube['values']
+    plots, dates, _ = values.shape
+    df = pd.DataFrame(values.reshape(plots * dates, -1), columns=cube['indices'])
+    df.insert(0, 'date', np.tile(np.asarray(cube['dates'], dtype=object), plots))
+    df.insert(0, 'FID', np.repeat(cube['FID'], dates))
+    return df
+
+
+def _grid_key(raster: rasterio.DatasetReader) -> tuple:
+    """底图网格的键, 由坐标系、仿射变换与尺寸组成"""
+    return (str(raster.crs), tuple(raster.transform), raster.shape)
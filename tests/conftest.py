@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 脚本与模块都以仓库根目录为导入起点
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from utils.index_utils import evaluate_indices
+
+# rvi = nir / red, 红光为0时依次得到 +inf、-inf、NaN 与一个正常值
+BANDS = {
+    'nir': np.array([1.0, -1.0, 0.0, 3.0]),
+    'red': np.array([0.0, 0.0, 0.0, 2.0]),
+}
+
+
+@pytest.mark.parametrize('kwargs, expected', [
+    ({}, [np.inf, -np.inf, np.nan, 1.5]),
+    ({'nan': -9}, [np.inf, -np.inf, -9, 1.5]),
+    ({'posinf': 7}, [7, -np.inf, np.nan, 1.5]),
+    ({'neginf': -7}, [np.inf, -7, np.nan, 1.5]),
+    ({'nan': 0, 'posinf': 7, 'neginf': -7}, [7, -7, 0, 1.5]),
+])
+def test_evaluate_indices_replaces_only_requested_values(kwargs, expected):
+    rvi = evaluate_indices(BANDS, ['rvi'], **kwargs)['rvi']
+    np.testing.assert_array_equal(rvi, np.array(expected, dtype=np.float32))
+
+
+def test_evaluate_indices_repeated_operand():
+    # 同一步骤两次引用同一个中间结果时只释放一次
+    msavi = evaluate_indices({'nir': np.array([0.5, 0.8]), 'red': np.array([0.1, 0.2])}, ['msavi'])['msavi']
+    nir, red = np.array([0.5, 0.8]), np.array([0.1, 0.2])
+    expected = (2 * nir + 1 - np.sqrt((2 * nir + 1) ** 2 - 8 * (nir - red))) / 2
+    np.testing.assert_allclose(msavi, expected, rtol=1e-6)
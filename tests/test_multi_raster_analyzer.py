@@ -0,0 +1,96 @@
+import os
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from shapely.geometry import box
+from core.multi_raster_analyzer import MultiRasterAnalyzer, PlotMaskIndex
+
+CRS = 'EPSG:32650'
+
+
+@pytest.fixture
+def field(tmp_path):
+    """生成一张 40x40 的双波段底图与三个区块的shp文件"""
+    transform = from_origin(500000, 4000040, 1, 1)
+    data = np.arange(2 * 40 * 40, dtype=np.float32).reshape(2, 40, 40)
+    raster_path = str(tmp_path / 'ms.tif')
+    with rasterio.open(raster_path, 'w', driver='GTiff', height=40, width=40, count=2,
+                       dtype='float32', crs=CRS, transform=transform) as dst:
+        dst.write(data)
+
+    tiles = gpd.GeoDataFrame({'FID': [1, 2, 3]}, geometry=[
+        box(500002, 4000030, 500010, 4000038),
+        box(500015, 4000012.5, 500027.5, 4000025),
+        box(500030, 4000001, 500039, 4000009),
+    ], crs=CRS)
+    shp_path = str(tmp_path / 'shape.shp')
+    tiles.to_file(shp_path)
+    return shp_path, raster_path
+
+
+def _assert_same_index(actual, expected):
+    np.testing.assert_array_equal(actual.windows, expected.windows)
+    np.testing.assert_array_equal(actual.offsets, expected.offsets)
+    np.testing.assert_array_equal(actual.pixels, expected.pixels)
+
+
+def test_load_or_build_caches_index(field, tmp_path):
+    shp_path, raster_path = field
+    tile_geoms = gpd.read_file(shp_path).geometry.values
+    cache_dir = str(tmp_path / 'cache')
+    with rasterio.open(raster_path) as src:
+        built = PlotMaskIndex.load_or_build(tile_geoms, src, cache_dir)
+        assert len(os.listdir(cache_dir)) == 1
+        _assert_same_index(PlotMaskIndex.load_or_build(tile_geoms, src, cache_dir), built)
+
+
+def test_unwritable_index_cache_builds_without_caching(field, tmp_path):
+    shp_path, raster_path = field
+    # 缓存目录位于普通文件之下, 无法创建
+    blocker = tmp_path / 'blocker'
+    blocker.write_text('')
+    cache_dir = str(blocker / '.plot_index')
+
+    tile_geoms = gpd.read_file(shp_path).geometry.values
+    with rasterio.open(raster_path) as src:
+        expected = PlotMaskIndex.build(tile_geoms, src.transform, src.height, src.width)
+        _assert_same_index(PlotMaskIndex.load_or_build(tile_geoms, src, cache_dir), expected)
+
+    analyzer = MultiRasterAnalyzer(shp_path, [('ms', raster_path)], index_cache_dir=cache_dir)
+    tiles = list(analyzer.iterate_tiles())
+    assert [tile_id for tile_id, _ in tiles] == [1, 2, 3]
+    assert not os.path.exists(cache_dir)
+
+
+@pytest.mark.parametrize('plan', ['tile', 'strip'])
+def test_masked_tiles_accept_further_masking(field, tmp_path, plan):
+    shp_path, raster_path = field
+    analyzer = MultiRasterAnalyzer(shp_path, [('ms', raster_path)], index_cache_dir=str(tmp_path / 'cache'))
+    for tile_id, data in analyzer.iterate_tiles(mode='masked', plan=plan):
+        arr = data['ms']
+        outside = arr.mask.copy()
+        threshold = np.ma.median(arr)
+        arr[arr > threshold] = np.ma.masked
+        assert arr.mask[outside].all()
+        assert arr.count() > 0
+
+
+def test_export_keeps_last_non_null_value_per_fid(field, tmp_path):
+    shp_path, raster_path = field
+    analyzer = MultiRasterAnalyzer(shp_path, [('ms', raster_path)], index_cache_dir=str(tmp_path / 'cache'))
+    results = [
+        {'FID': 1, 'zz': 270, 'ndvi': None},
+        {'FID': 1, 'zz': None, 'ndvi': 0.5},
+        {'FID': 2, 'zz': 10},
+        {'FID': 2, 'zz': 20},
+    ]
+    output_path = str(tmp_path / 'out.geojson')
+    assert analyzer.export_results_to_geojson(results, output_path)
+
+    output = gpd.read_file(output_path).set_index('FID')
+    assert output.loc[1, 'zz'] == 270
+    assert output.loc[1, 'ndvi'] == 0.5
+    assert output.loc[2, 'zz'] == 20
+    assert np.isnan(output.loc[3, 'zz'])
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('numba')
+
+from utils import stats_utils
+from utils.stats_utils import compute_all_stats
+
+# 统计指标与原有 calculate_* 函数的对应关系
+CALCULATE_FUNCTIONS = {
+    'mean': stats_utils.calculate_mean,
+    'std': stats_utils.calculate_std,
+    'mode': stats_utils.calculate_mode,
+    'var': stats_utils.calculate_variance,
+    'median': stats_utils.calculate_median,
+    'iqr': stats_utils.calculate_iqr,
+    'range': stats_utils.calculate_range,
+    'skew': stats_utils.calculate_skewness,
+    'kurt': stats_utils.calculate_kurtosis,
+    'cv': stats_utils.calculate_coefficient_of_variation,
+    'uni': stats_utils.calculate_uniformity,
+}
+
+# 由排序结果得到的指标, 两个后端应逐位一致
+EXACT_STATS = ('mode', 'range')
+
+# 无量纲的高阶矩, scipy对float32在单精度中计算, 接近0时只能按绝对误差比较
+MOMENT_STATS = ('skew', 'kurt')
+
+
+def _sample_inputs():
+    """各类型与边界情况的输入"""
+    rng = np.random.default_rng(20240616)
+    float32 = rng.normal(0.4, 0.2, 2000).astype(np.float32)
+    float32[rng.random(2000) < 0.1] = np.nan
+    float64 = rng.exponential(1.0, 1500)
+    float64[::37] = np.nan
+    return {
+        'float32': float32,
+        'float64': float64,
+        'rounded': np.round(rng.normal(0.3, 0.1, 800), 2).astype(np.float32),
+        'uint8': rng.integers(0, 256, 3000).astype(np.uint8),
+        'int16': rng.integers(-2000, 2000, 500).astype(np.int16),
+        'int32': rng.integers(-50, 50, 1000).astype(np.int32),
+        'constant': np.full(50, 0.25, dtype=np.float32),
+        'nan_only': np.full(10, np.nan),
+        'empty': np.array([], dtype=np.float32),
+        'n1': np.array([0.5]),
+        'n2': np.array([0.5, np.nan, 0.75]),
+        'n3': np.array([0.1, 0.4, 0.2], dtype=np.float32),
+        'n4': np.array([1, 7, 3, 2], dtype=np.int32),
+    }
+
+
+SAMPLES = _sample_inputs()
+
+
+def _assert_same(actual, expected, rtol, atol=1e-12):
+    np.testing.assert_allclose(np.float64(actual), np.float64(expected), rtol=rtol, atol=atol, equal_nan=True)
+
+
+@pytest.mark.filterwarnings('ignore::RuntimeWarning')
+@pytest.mark.parametrize('backend', ['numba', 'numpy'])
+@pytest.mark.parametrize('stat', list(CALCULATE_FUNCTIONS))
+@pytest.mark.parametrize('sample', list(SAMPLES))
+def test_compute_all_stats_matches_calculate_functions(sample, stat, backend):
+    index = SAMPLES[sample]
+    expected = CALCULATE_FUNCTIONS[stat]({'x': index})
+    actual = compute_all_stats({'x': index}, stats=[stat], backend=backend)
+    assert actual.keys() == expected.keys()
+
+    # 原有函数对float32在单精度中累加, 新实现在双精度中累加
+    single = index.dtype == np.float32
+    rtol = 0 if stat in EXACT_STATS else (1e-5 if single else 1e-9)
+    atol = 1e-5 if single and stat in MOMENT_STATS else 1e-12
+    for key in expected:
+        _assert_same(actual[key], expected[key], rtol, atol)
+
+
+@pytest.mark.filterwarnings('ignore::RuntimeWarning')
+@pytest.mark.parametrize('sample', list(SAMPLES))
+def test_backends_agree_on_all_stats(sample):
+    index = SAMPLES[sample]
+    compiled = compute_all_stats({'x': index}, backend='numba')
+    reference = compute_all_stats({'x': index}, backend='numpy')
+    assert compiled.keys() == reference.keys()
+    for key in reference:
+        rtol = 0 if key.startswith(('mode_', 'rng_', 'medi_', 'iqr_')) else 1e-9
+        _assert_same(compiled[key], reference[key], rtol)
+
+
+@pytest.mark.filterwarnings('ignore::RuntimeWarning')
+@pytest.mark.parametrize('sample', list(SAMPLES))
+def test_calculate_mode_matches_numpy_histogram(sample):
+    # 安装numba时 calculate_mode 走编译内核, 结果仍应与 np.histogram(bins='auto') 一致
+    index = SAMPLES[sample]
+    clean_index = index[~np.isnan(index)]
+    if len(clean_index) == 0:
+        expected = np.nan
+    else:
+        hist, bins = np.histogram(clean_index, bins='auto')
+        expected = bins[np.argmax(hist)]
+    assert stats_utils.DEFAULT_STATS_BACKEND == 'numba'
+    _assert_same(stats_utils.calculate_mode({'x': index})['mode_x'], expected, 0)
+
+
+def test_unsupported_dtype_falls_back_to_numpy():
+    # float16 不被numba支持, 应回退到NumPy实现
+    index = np.array([0.1, 0.2, 0.4, np.nan], dtype=np.float16)
+    compiled = compute_all_stats({'x': index}, stats=['mean', 'median'], backend='numba')
+    reference = compute_all_stats({'x': index}, stats=['mean', 'median'], backend='numpy')
+    assert compiled == reference
+
+
+def test_unknown_backend_raises():
+    with pytest.raises(ValueError):
+        compute_all_stats({'x': np.arange(3.0)}, backend='cuda')
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import pandas as pd
+import pyarrow.parquet as pq
+from typing import Callable, List, Optional
+from utils.file_utils import create_dir_if_not_exists, read_columnar, write_columnar
+
+
+# 默认缓存目录
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'smart-breeding-algorithms', 'sources')
+
+# shapefile 的属性、索引与坐标系存放在同名的附属文件中, 它们变化也要使缓存失效
+_SIDECAR_EXTENSIONS = ('.dbf', '.shx', '.prj', '.cpg')
+
+
+def source_fingerprint(file_path: str) -> str:
+    """根据文件路径、大小与修改时间计算数据源指纹, shapefile 同时包含附属文件
+
+    Args:
+        file_path: 数据文件路径
+
+    Returns:
+        指纹字符串
+    """
+    paths = [file_path]
+    base, ext = os.path.splitext(file_path)
+    if ext.lower() == '.shp':
+        paths += [base + sidecar for sidecar in _SIDECAR_EXTENSIONS if os.path.exists(base + sidecar)]
+
+    digest = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def read_with_cache(file_path: str, parser: Callable[[], pd.DataFrame],
+                    cache_dir: str = DEFAULT_CACHE_DIR, columns: Optional[List[str]] = None,
+                    max_size_mb: float = 1024) -> pd.DataFrame:
+    """读取数据源, 命中缓存时直接读取已解析的Parquet, 否则解析后写入缓存
+
+    缓存以完整数据源为单位保存, 字段投影在读取缓存时进行;
+    无法保存为Parquet的数据 (如混合类型的列) 不缓存, 直接返回解析结果
+
+    Args:
+        file_path: 数据文件路径
+        parser: 完整解析数据文件的函数
+        cache_dir: 缓存目录
+        columns: 只读取的字段, 为None时读取全部字段
+        max_size_mb: 缓存目录的大小上限(MB), 超出时按最近最少使用淘汰
+
+    Returns:
+        数据框
+    """
+    cache_path = os.path.join(cache_dir, f"{source_fingerprint(file_path)}.parquet")
+
+    if os.path.exists(cache_path):
+        # 更新修改时间, 作为最近使用时间
+        os.utime(cache_path)
+        if columns is not None:
+            # 按数据源中的字段顺序投影, 忽略不存在的字段
+            names = pq.read_schema(cache_path).names
+            columns = [c for c in names if c in columns]
+        return read_columnar(cache_path, 'parquet', columns)
+
+    df = parser()
+    create_dir_if_not_exists(cache_dir)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        write_columnar(df, tmp_path, 'parquet')
+        os.replace(tmp_path, cache_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return _select_columns(df, columns)
+
+    evict_cache(cache_dir, max_size_mb)
+    return _select_columns(df, columns)
+
+
+def _select_columns(df: pd.DataFrame, columns: Optional[List[str]]) -> pd.DataFrame:
+    """按字段投影数据框, 与读取缓存时的投影一致"""
+    if columns is None:
+        return df
+    return df[[c for c in df.columns if c in columns]]
+
+
+def evict_cache(cache_dir: str = DEFAULT_CACHE_DIR, max_size_mb: float = 1024) -> int:
+    """按最近最少使用淘汰缓存文件, 直到缓存目录不超过大小上限
+
+    Args:
+        cache_dir: 缓存目录
+        max_size_mb: 缓存目录的大小上限(MB)
+
+    Returns:
+        淘汰的文件数
+    """
+    if not os.path.isdir(cache_dir):
+        return 0
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith('.parquet'):
+            continue
+        path = os.path.join(cache_dir, name)
+        stat = os.stat(path)
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    limit = max_size_mb * 1024 * 1024
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        os.remove(path)
+        total -= size
+        removed += 1
+    return removed
+
+
+def clear_cache(cache_dir: str = DEFAULT_CACHE_DIR) -> int:
+    """清空缓存目录
+
+    Args:
+        cache_dir: 缓存目录
+
+    Returns:
+        删除的文件数
+    """
+    return evict_cache(cache_dir, 0)
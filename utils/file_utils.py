@@ -45,3 +45,74 @@ def create_dir_if_not_exists(dir_path: str) -> bool:
         return False
     except Exception as e:
         raise Exception(f"创建目录时出错: {str(e)}")
+
+
+# 列式存储格式与对应的文件扩展名
+COLUMNAR_FORMATS = {
+    'parquet': ('.parquet', '.geoparquet'),
+    'feather': ('.feather', '.arrow'),
+}
+
+
+def get_columnar_format(file_path: str) -> Optional[str]:
+    """根据扩展名判断列式存储格式
+
+    Args:
+        file_path: 文件路径
+
+    Returns:
+        'parquet'、'feather', 不是列式存储格式时为None
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    for file_type, extensions in COLUMNAR_FORMATS.items():
+        if ext in extensions:
+            return file_type
+    return None
+
+
+def read_columnar(file_path: str, file_type: str = 'parquet', columns: Optional[list] = None) -> pd.DataFrame:
+    """读取Parquet/Feather文件, 含地理元数据(GeoParquet)时返回GeoDataFrame
+
+    Args:
+        file_path: 文件路径
+        file_type: 文件类型 ('parquet', 'feather')
+        columns: 只读取的列, 为None时读取全部列
+
+    Returns:
+        数据框
+    """
+    if file_type == 'parquet':
+        try:
+            return gpd.read_parquet(file_path, columns=columns)
+        except ValueError:
+            # 没有地理元数据, 按普通表读取
+            return pd.read_parquet(file_path, columns=columns)
+    if file_type == 'feather':
+        try:
+            return gpd.read_feather(file_path, columns=columns)
+        except ValueError:
+            return pd.read_feather(file_path, columns=columns)
+    raise ValueError(f"不支持的列式存储格式: {file_type}")
+
+
+def write_columnar(df: pd.DataFrame, file_path: str, file_type: str = 'parquet',
+                   compression: str = 'zstd') -> None:
+    """写出Parquet/Feather文件, GeoDataFrame写为GeoParquet/GeoArrow, 字段名不受长度限制
+
+    Args:
+        df: 数据框
+        file_path: 输出文件路径
+        file_type: 文件类型 ('parquet', 'feather')
+        compression: 列压缩算法
+    """
+    # 含几何列的普通数据框转换为GeoDataFrame, 保留地理元数据
+    if not isinstance(df, gpd.GeoDataFrame) and 'geometry' in df.columns:
+        df = gpd.GeoDataFrame(df, geometry='geometry')
+
+    if file_type == 'parquet':
+        df.to_parquet(file_path, compression=compression, index=False)
+    elif file_type == 'feather':
+        # feather 不保存索引, 需要默认索引
+        df.reset_index(drop=True).to_feather(file_path, compression=compression)
+    else:
+        raise ValueError(f"不支持的列式存储格式: {file_type}")
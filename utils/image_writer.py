@@ -0,0 +1,149 @@
+import threading
+import numpy as np
+import rasterio
+from concurrent.futures import Future, ThreadPoolExecutor
+from PIL import Image
+from typing import Callable, List
+
+
+def rgba_from_rgb(rgb: np.ndarray, mask: np.ndarray | None = None, transparent_black: bool = True) -> np.ndarray:
+    """由(波段, 行, 列)的RGB数组直接构建RGBA图像, 不经过PIL的通道拆分与合并
+
+    Args:
+        rgb: (波段, 行, 列)的uint8数组, 只使用前3个波段
+        mask: 区块内为True的掩膜, 区块外像素透明, 为None时不使用
+        transparent_black: 是否将黑色像素（所有通道都为0）设置为透明
+
+    Returns:
+        (行, 列, 4)的uint8数组
+    """
+    rgba = np.empty(rgb.shape[1:] + (4,), dtype=np.uint8)
+    rgba[..., :3] = np.moveaxis(rgb[:3], 0, -1)
+
+    opaque = np.ones(rgb.shape[1:], dtype=bool) if mask is None else mask.copy()
+    if transparent_black:
+        opaque &= rgba[..., :3].any(axis=-1)
+    rgba[..., 3] = np.where(opaque, 255, 0)
+    return rgba
+
+
+def write_png(output_path: str, rgba: np.ndarray) -> None:
+    """将RGBA数组保存为PNG
+
+    Args:
+        output_path: 输出文件路径
+        rgba: (行, 列, 4)的uint8数组
+    """
+    Image.fromarray(rgba, mode='RGBA').save(output_path, format='PNG', lossless=True)
+
+
+def write_geotiff(output_path: str, data: np.ndarray, meta: dict) -> None:
+    """将(波段, 行, 列)数组保存为GeoTIFF
+
+    Args:
+        output_path: 输出文件路径
+        data: (波段, 行, 列)数组
+        meta: rasterio元数据
+    """
+    with rasterio.open(output_path, 'w', **meta) as dst:
+        dst.write(data)
+
+
+class ImageWriter:
+    def __init__(self, workers: int = 4, max_pending: int = 64):
+        """后台图像写出器, 由线程池编码并写出图像, 提取像素的线程无需等待编码与磁盘写入
+
+        提交的任务数超过 max_pending 时提交会阻塞, 使等待写出的图像占用的内存有上限;
+        PNG压缩与GeoTIFF写入在C代码中释放GIL, 多个线程可以同时编码
+
+        Args:
+            workers: 写出线程数
+            max_pending: 同时在途的最大任务数
+        """
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-writer')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._errors = []
+        self.written = []
+
+    def submit(self, output_path: str, func: Callable, *args) -> None:
+        """提交写出任务
+
+        Args:
+            output_path: 输出文件路径
+            func: 写出函数, 调用方式为 func(output_path, *args)
+            *args: 写出函数的其它参数
+        """
+        self._raise_errors()
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(func, output_path, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda done: self._on_done(done, output_path))
+
+    def submit_png(self, output_path: str, rgb: np.ndarray, mask: np.ndarray | None = None,
+                   transparent_black: bool = True) -> None:
+        """提交PNG写出任务, RGBA图像的构建也在写出线程中完成
+
+        Args:
+            output_path: 输出文件路径
+            rgb: (波段, 行, 列)的uint8数组, 提交后不应再修改
+            mask: 区块内为True的掩膜, 区块外像素透明
+            transparent_black: 是否将黑色像素设置为透明
+        """
+        self.submit(output_path, _encode_png, rgb, mask, transparent_black)
+
+    def submit_geotiff(self, output_path: str, data: np.ndarray, meta: dict) -> None:
+        """提交GeoTIFF写出任务
+
+        Args:
+            output_path: 输出文件路径
+            data: (波段, 行, 列)数组, 提交后不应再修改
+            meta: rasterio元数据
+        """
+        self.submit(output_path, write_geotiff, data, meta)
+
+    def close(self) -> List[str]:
+        """等待所有任务完成并关闭线程池, 有任务失败时抛出异常
+
+        Returns:
+            成功写出的文件路径列表
+        """
+        self._executor.shutdown(wait=True)
+        self._raise_errors()
+        return self.written
+
+    def _on_done(self, future: Future, output_path: str) -> None:
+        """任务完成回调: 释放在途名额并记录结果"""
+        self._slots.release()
+        error = future.exception()
+        with self._lock:
+            if error is None:
+                self.written.append(output_path)
+            else:
+                self._errors.append((output_path, error))
+
+    def _raise_errors(self) -> None:
+        """有任务失败时抛出第一个错误"""
+        with self._lock:
+            if not self._errors:
+                return
+            output_path, error = self._errors[0]
+        raise IOError(f"写出图像{output_path}时出错: {str(error)}") from error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._executor.shutdown(wait=True)
+        return False
+
+
+def _encode_png(output_path: str, rgb: np.ndarray, mask: np.ndarray | None, transparent_black: bool) -> None:
+    """构建RGBA图像并保存为PNG, 在写出线程中运行"""
+    write_png(output_path, rgba_from_rgb(rgb, mask, transparent_black))
@@ -0,0 +1,280 @@
+import ast
+import numpy as np
+from typing import Dict, List, Tuple
+
+
+# 植被指数公式注册表, 公式为基于波段名的表达式
+# 多波段底图的通道用 底图名_通道 表示, 如 rgb_r/rgb_g/rgb_b
+INDEX_EXPRESSIONS = {
+    'ndvi': '(nir - red) / (nir + red)',
+    'evi': '2.5 * (nir - red) / (nir + 6 * red - 7.5 * blue + 1)',
+    'rvi': 'nir / red',
+    'gndvi': '(nir - green) / (nir + green)',
+    'tvi': '60 * (nir - green) - 100 * (red - green)',
+    'dvi': 'nir - red',
+    'savi': '(1 + 0.5) * (nir - red) / (nir + red + 0.5)',
+    'osavi': '(1 + 0.16) * (nir - red) / (nir + red + 0.16)',
+    'ndwi': '(green - nir) / (green + nir)',
+    'msavi': '(2 * nir + 1 - sqrt((2 * nir + 1) ** 2 - 8 * (nir - red))) / 2',
+    'gcvi': '(nir / green) - 1',
+    'rndvi': '(rededge1 - red) / (rededge1 + red)',
+    'ndre': '(nir - rededge1) / (nir + rededge1)',
+    'rri1': 'nir / rededge1',
+    'rri2': 'rededge1 / nir',
+    'msrre': '(nir - rededge1 - 1) / (sqrt(nir - rededge1) + 1)',
+    'clre': '(nir / rededge1) - 1',
+    'ireci': '(rededge3 - red) / (rededge1 / rededge2)',
+    'lswi': '(nir - swir1) / (nir + swir1)',
+    'exg': '2 * rgb_g - rgb_r - rgb_b',
+}
+
+# 多波段底图的通道后缀, 第5个及之后的通道用从1开始的序号, 如 ms_5
+CHANNEL_SUFFIXES = {'r': 0, 'g': 1, 'b': 2, 'a': 3}
+
+_BINARY_OPS = {
+    ast.Add: (np.add, '+'),
+    ast.Sub: (np.subtract, '-'),
+    ast.Mult: (np.multiply, '*'),
+    ast.Div: (np.true_divide, '/'),
+    ast.Pow: (np.power, '**'),
+}
+
+_FUNCTIONS = {
+    'sqrt': np.sqrt,
+    'abs': np.abs,
+    'log': np.log,
+    'exp': np.exp,
+}
+
+
+def register_index(name: str, expression: str) -> None:
+    """注册或覆盖植被指数公式
+
+    Args:
+        name: 指数名
+        expression: 基于波段名的表达式
+    """
+    _parse_expression(expression)
+    INDEX_EXPRESSIONS[name] = expression
+
+
+def required_bands(index_names: List[str]) -> List[str]:
+    """获取计算指定指数所需的波段名
+
+    Args:
+        index_names: 指数名列表
+
+    Returns:
+        波段名列表 (含 rgb_r 这类通道名)
+    """
+    bands = set()
+    for name in index_names:
+        tree = _parse_expression(_get_expression(name))
+        bands.update(node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and node.id not in _FUNCTIONS)
+    return sorted(bands)
+
+
+def required_rasters(index_names: List[str]) -> List[str]:
+    """获取计算指定指数所需的底图名, 通道名会归并到所属的底图
+
+    Args:
+        index_names: 指数名列表
+
+    Returns:
+        底图名列表
+    """
+    rasters = set()
+    for band in required_bands(index_names):
+        channel = parse_channel_name(band)
+        rasters.add(band if channel is None else channel[0])
+    return sorted(rasters)
+
+
+def channel_name(raster: str, channel: int) -> str:
+    """获取多波段底图通道的波段名, 与指数公式中的写法一致
+
+    Args:
+        raster: 底图名
+        channel: 通道序号(从0开始)
+
+    Returns:
+        如 rgb_r/rgb_g/rgb_b, 第5个及之后的通道为 底图名_序号 (从1开始)
+    """
+    suffixes = list(CHANNEL_SUFFIXES)
+    suffix = suffixes[channel] if channel < len(suffixes) else str(channel + 1)
+    return f"{raster}_{suffix}"
+
+
+def parse_channel_name(name: str) -> Tuple[str, int] | None:
+    """将 底图名_通道 形式的波段名解析为 (底图名, 通道序号(从0开始)), 不是通道名时返回None"""
+    raster, _, suffix = name.rpartition('_')
+    if not raster:
+        return None
+    if suffix in CHANNEL_SUFFIXES:
+        return raster, CHANNEL_SUFFIXES[suffix]
+    if suffix.isdigit() and int(suffix) > len(CHANNEL_SUFFIXES):
+        return raster, int(suffix) - 1
+    return None
+
+
+def evaluate_indices(bands: Dict[str, np.ndarray], index_names: List[str],
+                     chunk_size: int = 1 << 20, dtype=np.float32,
+                     nan: float | None = None, posinf: float | None = None,
+                     neginf: float | None = None) -> Dict[str, np.ndarray]:
+    """计算植被指数
+
+    所有指数的公式合并为一张计算图, 相同的子表达式 (如 nir + red) 只计算一次;
+    按 chunk_size 个像素分块计算, 中间结果用完即释放, 峰值内存与分块大小成正比.
+    波段在计算前转换为 dtype, 避免整型波段溢出
+
+    Args:
+        bands: {波段名: 像素数组}, 多波段底图可直接传入, 通过 底图名_通道 引用其通道
+        index_names: 指数名列表
+        chunk_size: 每块像素数
+        dtype: 计算与输出的数据类型
+        nan: 替换NaN的值, 为None时不替换
+        posinf: 替换正无穷的值, 为None时不替换
+        neginf: 替换负无穷的值, 为None时不替换
+
+    Returns:
+        {指数名: 指数数组}, 形状与所用波段相同
+    """
+    steps, outputs = _compile(index_names)
+
+    # 解析所需波段, 展平为一维视图
+    flat_bands = {}
+    shape = None
+    for key, kind, payload, _ in steps:
+        if kind != 'band':
+            continue
+        band = _resolve_band(bands, payload)
+        if shape is None:
+            shape = band.shape
+        elif band.size != int(np.prod(shape)):
+            raise ValueError(f"波段{payload}的像素数与其它波段不一致")
+        flat_bands[key] = band.reshape(-1)
+    if shape is None:
+        raise ValueError("指数公式中没有使用任何波段")
+
+    size = int(np.prod(shape))
+    results = {name: np.empty(size, dtype=dtype) for name in index_names}
+
+    # 每个中间结果最后一次被使用的步骤, 之后即可释放
+    last_use = {}
+    for i, (_, _, _, args) in enumerate(steps):
+        for arg in args:
+            last_use[arg] = i
+    keep = set(outputs.values())
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for start in range(0, size, chunk_size):
+            stop = min(start + chunk_size, size)
+            values = {}
+            for i, (key, kind, payload, args) in enumerate(steps):
+                if kind == 'band':
+                    values[key] = flat_bands[key][start:stop].astype(dtype)
+                elif kind == 'const':
+                    values[key] = dtype(payload)
+                else:
+                    values[key] = payload(*(values[arg] for arg in args))
+                # 同一步骤可能两次引用同一个键 (如 nir * nir), 只释放一次
+                for arg in dict.fromkeys(args):
+                    if last_use[arg] == i and arg not in keep:
+                        del values[arg]
+            for name, key in outputs.items():
+                results[name][start:stop] = values[key]
+
+    # 只替换调用方指定的值, np.nan_to_num 会把未指定的值也替换为默认值
+    for name, index in results.items():
+        if nan is not None:
+            index[np.isnan(index)] = nan
+        if posinf is not None:
+            index[index == np.inf] = posinf
+        if neginf is not None:
+            index[index == -np.inf] = neginf
+        results[name] = index.reshape(shape)
+    return results
+
+
+def _get_expression(name: str) -> str:
+    """获取指数公式"""
+    if name not in INDEX_EXPRESSIONS:
+        raise ValueError(f"未注册的指数: {name}")
+    return INDEX_EXPRESSIONS[name]
+
+
+def _parse_expression(expression: str) -> ast.Expression:
+    """解析并校验指数公式, 只允许四则运算、乘方、取负与 _FUNCTIONS 中的函数"""
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f"指数公式语法错误: {expression}") from e
+
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Expression, ast.Name, ast.Load, ast.USub, ast.UAdd)):
+            continue
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+            continue
+        if isinstance(node, tuple(_BINARY_OPS)) or isinstance(node, ast.UnaryOp):
+            continue
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            continue
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) \
+                and node.func.id in _FUNCTIONS and len(node.args) == 1 and not node.keywords:
+            continue
+        raise ValueError(f"指数公式中包含不支持的语法: {expression}")
+    return tree
+
+
+def _compile(index_names: List[str]) -> Tuple[List[tuple], Dict[str, str]]:
+    """将多个指数公式编译为共享子表达式的计算步骤
+
+    Returns:
+        (计算步骤列表 [(键, 类型, 参数, 依赖键)], {指数名: 结果键})
+    """
+    steps = []
+    seen = set()
+
+    def add(key, kind, payload, args=()):
+        if key not in seen:
+            seen.add(key)
+            steps.append((key, kind, payload, args))
+        return key
+
+    def visit(node):
+        if isinstance(node, ast.Expression):
+            return visit(node.body)
+        if isinstance(node, ast.Constant):
+            return add(repr(float(node.value)), 'const', float(node.value))
+        if isinstance(node, ast.Name):
+            return add(node.id, 'band', node.id)
+        if isinstance(node, ast.UnaryOp):
+            operand = visit(node.operand)
+            if isinstance(node.op, ast.UAdd):
+                return operand
+            return add(f"(-{operand})", 'op', np.negative, (operand,))
+        if isinstance(node, ast.Call):
+            arg = visit(node.args[0])
+            return add(f"{node.func.id}({arg})", 'op', _FUNCTIONS[node.func.id], (arg,))
+        left = visit(node.left)
+        right = visit(node.right)
+        func, symbol = _BINARY_OPS[type(node.op)]
+        # 加法和乘法满足交换律, 规范化操作数顺序以便识别相同子表达式
+        if isinstance(node.op, (ast.Add, ast.Mult)):
+            left, right = sorted((left, right))
+        return add(f"({left}{symbol}{right})", 'op', func, (left, right))
+
+    outputs = {}
+    for name in index_names:
+        outputs[name] = visit(_parse_expression(_get_expression(name)))
+    return steps, outputs
+
+
+def _resolve_band(bands: Dict[str, np.ndarray], name: str) -> np.ndarray:
+    """按名称获取波段, 支持 底图名_通道 形式引用多波段底图的通道"""
+    if name in bands:
+        return np.asarray(bands[name])
+    channel = parse_channel_name(name)
+    if channel is not None and channel[0] in bands:
+        return np.asarray(bands[channel[0]])[channel[1]]
+    raise ValueError(f"缺少计算指数所需的波段: {name}")
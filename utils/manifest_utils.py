@@ -0,0 +1,101 @@
+import json
+import os
+import time
+from typing import List
+from utils.cache_utils import source_fingerprint
+
+
+# 清单文件名, 保存在每个输出目录下
+MANIFEST_NAME = 'manifest.json'
+
+
+def load_manifest(output_dir: str) -> dict:
+    """读取输出目录下的处理清单, 不存在或损坏时返回空清单
+
+    Args:
+        output_dir: 输出目录
+
+    Returns:
+        处理清单
+    """
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as json_file:
+                manifest = json.load(json_file)
+            if isinstance(manifest.get('stages'), dict):
+                return manifest
+        except (OSError, ValueError):
+            pass
+    return {'stages': {}}
+
+
+def save_manifest(output_dir: str, manifest: dict) -> None:
+    """保存处理清单, 先写临时文件再替换, 避免中断时留下损坏的清单
+
+    Args:
+        output_dir: 输出目录
+        manifest: 处理清单
+    """
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as json_file:
+        json.dump(manifest, json_file, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+def stage_signature(inputs: List[str], params: dict) -> dict:
+    """计算处理步骤的签名, 由输入文件指纹(路径、大小与修改时间)与步骤参数组成
+
+    Args:
+        inputs: 输入文件路径列表
+        params: 步骤参数, 需可序列化为JSON
+
+    Returns:
+        步骤签名
+    """
+    return {
+        'inputs': {str(path): source_fingerprint(str(path)) for path in inputs if os.path.exists(path)},
+        # 经过一次JSON往返, 使元组等类型与读取的清单一致
+        'params': json.loads(json.dumps(params)),
+    }
+
+
+def is_stage_current(manifest: dict, stage: str, signature: dict) -> bool:
+    """判断处理步骤是否无需重做: 输入与参数未变化, 且记录的输出文件都存在且未被修改
+
+    Args:
+        manifest: 处理清单
+        stage: 步骤名
+        signature: 当前的步骤签名
+
+    Returns:
+        是否无需重做
+    """
+    record = manifest['stages'].get(stage)
+    if record is None:
+        return False
+    if record.get('inputs') != signature['inputs'] or record.get('params') != signature['params']:
+        return False
+    for path, fingerprint in record.get('outputs', {}).items():
+        if not os.path.exists(path) or source_fingerprint(path) != fingerprint:
+            return False
+    return True
+
+
+def record_stage(manifest: dict, stage: str, signature: dict, outputs: List[str]) -> None:
+    """在清单中记录已完成的处理步骤及其输出文件指纹
+
+    Args:
+        manifest: 处理清单
+        stage: 步骤名
+        signature: 步骤签名
+        outputs: 输出文件路径列表
+    """
+    manifest['stages'][stage] = {
+        'inputs': signature['inputs'],
+        'params': signature['params'],
+        'outputs': {str(path): source_fingerprint(str(path)) for path in outputs if os.path.exists(path)},
+        'updated': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
@@ -0,0 +1,420 @@
+import json
+import os
+import threading
+import numpy as np
+import rasterio
+import rasterio.errors
+import rasterio.shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+from typing import Dict, Iterator, List, Tuple
+from utils.file_utils import create_dir_if_not_exists
+from utils.index_utils import evaluate_indices, required_rasters
+
+
+def iter_row_strips(height: int, row_bytes: int, memory_budget_mb: float) -> Iterator[Tuple[int, int]]:
+    """按内存预算将行划分为条带
+
+    Args:
+        height: 总行数
+        row_bytes: 处理一行所需的字节数
+        memory_budget_mb: 单个条带的内存预算(MB)
+
+    Yields:
+        (起始行, 结束行)
+    """
+    strip_rows = max(1, int(memory_budget_mb * 1024 * 1024 // max(row_bytes, 1)))
+    for start in range(0, height, strip_rows):
+        yield start, min(start + strip_rows, height)
+
+
+def read_resampled_strips(src: rasterio.DatasetReader, out_shape: Tuple[int, int],
+                          memory_budget_mb: float = 512,
+                          resampling: Resampling = Resampling.bilinear) -> Iterator[Tuple[int, int, np.ndarray]]:
+    """按条带读取重采样到目标尺寸的底图, 峰值内存受预算限制
+
+    Args:
+        src: 底图数据集
+        out_shape: 目标尺寸(行, 列)
+        memory_budget_mb: 单个条带的内存预算(MB)
+        resampling: 重采样方法
+
+    Yields:
+        (目标起始行, 目标结束行, (波段, 行, 列)数组)
+    """
+    new_height, new_width = out_shape
+    row_scale = src.height / new_height
+    # 读取缓冲、float32副本与归一化结果都按一行计入预算
+    row_bytes = src.count * new_width * (np.dtype(src.dtypes[0]).itemsize + 8)
+    for start, stop in iter_row_strips(new_height, row_bytes, memory_budget_mb):
+        window = Window(0, start * row_scale, src.width, (stop - start) * row_scale)
+        data = src.read(
+            window=window,
+            out_shape=(src.count, stop - start, new_width),
+            resampling=resampling
+        )
+        yield start, stop, data
+
+
+def compute_band_ranges(src: rasterio.DatasetReader, out_shape: Tuple[int, int],
+                        memory_budget_mb: float = 512,
+                        resampling: Resampling = Resampling.bilinear) -> Tuple[np.ndarray, np.ndarray]:
+    """逐条带计算重采样后各波段的全局最小值与最大值
+
+    Args:
+        src: 底图数据集
+        out_shape: 目标尺寸(行, 列)
+        memory_budget_mb: 单个条带的内存预算(MB)
+        resampling: 重采样方法
+
+    Returns:
+        (各波段最小值, 各波段最大值), 全为NaN的波段为NaN
+    """
+    mins = np.full(src.count, np.inf)
+    maxs = np.full(src.count, -np.inf)
+    for _, _, data in read_resampled_strips(src, out_shape, memory_budget_mb, resampling):
+        data = data.reshape(src.count, -1)
+        if np.issubdtype(data.dtype, np.floating):
+            with np.errstate(invalid='ignore'):
+                valid = ~np.isnan(data)
+            if not valid.any():
+                continue
+            mins = np.minimum(mins, np.where(valid, data, np.inf).min(axis=1))
+            maxs = np.maximum(maxs, np.where(valid, data, -np.inf).max(axis=1))
+        elif data.size:
+            mins = np.minimum(mins, data.min(axis=1))
+            maxs = np.maximum(maxs, data.max(axis=1))
+    mins[np.isinf(mins)] = np.nan
+    maxs[np.isinf(maxs)] = np.nan
+    return mins, maxs
+
+
+def normalize_to_rgba(data: np.ndarray, mins: np.ndarray, maxs: np.ndarray) -> np.ndarray:
+    """将底图数据按全局范围归一化为RGBA预览图像
+
+    单波段(或不足3个波段时的第一个波段)输出灰度图, 0值透明;
+    3个及以上波段取前3个作为RGB, 三个通道均为0的像素透明
+
+    Args:
+        data: (波段, 行, 列)数组
+        mins: 各波段最小值
+        maxs: 各波段最大值
+
+    Returns:
+        (行, 列, 4)的uint8数组
+    """
+    bands = [0, 1, 2] if data.shape[0] >= 3 else [0]
+    rgba = np.empty(data.shape[1:] + (4,), dtype=np.uint8)
+    for channel, band in enumerate(bands):
+        lo, hi = mins[band], maxs[band]
+        if hi > lo:
+            band_norm = (data[band].astype(np.float32) - np.float32(lo)) / np.float32(hi - lo) * 255
+            rgba[..., channel] = np.nan_to_num(band_norm, nan=0).astype(np.uint8)
+        else:
+            rgba[..., channel] = 0
+
+    if len(bands) == 1:
+        rgba[..., 1] = rgba[..., 0]
+        rgba[..., 2] = rgba[..., 0]
+        # 将0值（原NaN值）设置为完全透明
+        transparent = rgba[..., 0] == 0
+    else:
+        # 检测黑色像素（所有通道都为0）并设置为透明
+        transparent = (rgba[..., 0] == 0) & (rgba[..., 1] == 0) & (rgba[..., 2] == 0)
+    rgba[..., 3] = np.where(transparent, 0, 255)
+    return rgba
+
+
+def render_preview(src: rasterio.DatasetReader, out_shape: Tuple[int, int],
+                   memory_budget_mb: float = 512,
+                   resampling: Resampling = Resampling.bilinear) -> np.ndarray:
+    """流式生成重采样后的RGBA预览图像
+
+    第一遍逐条带计算全局最小值与最大值, 第二遍逐条带归一化并写入预览数组,
+    除输出的uint8预览外, 峰值内存受预算限制
+
+    Args:
+        src: 底图数据集
+        out_shape: 预览尺寸(行, 列)
+        memory_budget_mb: 单个条带的内存预算(MB)
+        resampling: 重采样方法
+
+    Returns:
+        (行, 列, 4)的uint8数组
+    """
+    mins, maxs = compute_band_ranges(src, out_shape, memory_budget_mb, resampling)
+    preview = np.empty(tuple(out_shape) + (4,), dtype=np.uint8)
+    for start, stop, data in read_resampled_strips(src, out_shape, memory_budget_mb, resampling):
+        preview[start:stop] = normalize_to_rgba(data, mins, maxs)
+    return preview
+
+
+def resample_raster(src: rasterio.DatasetReader, output_path: str, out_shape: Tuple[int, int],
+                    memory_budget_mb: float = 512,
+                    resampling: Resampling = Resampling.bilinear) -> dict:
+    """按条带重采样底图并逐条带写入GeoTIFF
+
+    Args:
+        src: 底图数据集
+        output_path: 输出文件路径
+        out_shape: 目标尺寸(行, 列)
+        memory_budget_mb: 单个条带的内存预算(MB)
+        resampling: 重采样方法
+
+    Returns:
+        输出文件的元数据
+    """
+    new_height, new_width = out_shape
+    meta = src.meta.copy()
+    meta.update({
+        'driver': 'GTiff',
+        'height': new_height,
+        'width': new_width,
+        'transform': src.transform * src.transform.scale(src.width / new_width, src.height / new_height),
+        'crs': src.crs
+    })
+    with rasterio.open(output_path, 'w', **meta) as dst:
+        for start, stop, data in read_resampled_strips(src, out_shape, memory_budget_mb, resampling):
+            dst.write(data, window=Window(0, start, new_width, stop - start))
+    return meta
+
+
+def ensure_overviews(path: str, min_size: int = 256,
+                     resampling: Resampling = Resampling.average) -> List[int]:
+    """确保底图存在金字塔, 已有内部或外部金字塔时直接复用, 否则生成外部 .ovr 文件
+
+    生成金字塔后, 按较小尺寸读取底图时GDAL会直接从最接近的金字塔层读取,
+    读取开销与输出尺寸成正比而不是与原图尺寸成正比.
+    .ovr 文件写在底图旁边; 底图所在目录只读(如网络共享)导致无法生成时返回空列表,
+    调用方照常按原图重采样读取, 只是读取较慢
+
+    Args:
+        path: 底图文件路径
+        min_size: 最顶层金字塔的最小边长
+        resampling: 生成金字塔的重采样方法
+
+    Returns:
+        金字塔缩放因子列表
+    """
+    with rasterio.open(path) as src:
+        factors = src.overviews(1)
+        if factors:
+            return factors
+        size = max(src.width, src.height)
+
+    factors = []
+    factor = 2
+    while size / factor >= min_size:
+        factors.append(factor)
+        factor *= 2
+    if not factors:
+        return factors
+
+    # TIFF_USE_OVR 使金字塔写入外部 .ovr 文件, 不修改原始底图
+    ovr_path = f"{path}.ovr"
+    existed = os.path.exists(ovr_path)
+    try:
+        with rasterio.Env(TIFF_USE_OVR=True):
+            with rasterio.open(path, 'r+') as dst:
+                dst.build_overviews(factors, resampling)
+    except (rasterio.errors.RasterioError, OSError):
+        # 删除写了一半的 .ovr, 避免之后读取到不完整的金字塔
+        if not existed and os.path.exists(ovr_path):
+            try:
+                os.remove(ovr_path)
+            except OSError:
+                pass
+        return []
+    return factors
+
+
+def get_preview_shape(src: rasterio.DatasetReader, scale_factor: float,
+                      max_size: int | None = None) -> Tuple[int, int]:
+    """计算预览尺寸, 在读取前就应用最大边长限制, 只需一次重采样
+
+    Args:
+        src: 底图数据集
+        scale_factor: 缩放因子
+        max_size: 最大边长, 如WebP限制为16383
+
+    Returns:
+        预览尺寸(行, 列)
+    """
+    height = max(1, int(src.height * scale_factor))
+    width = max(1, int(src.width * scale_factor))
+    if max_size is not None and (width > max_size or height > max_size):
+        scale = min(max_size / width, max_size / height)
+        height = max(1, int(height * scale))
+        width = max(1, int(width * scale))
+    return height, width
+
+
+def export_tile_pyramid(image: np.ndarray, output_dir: str, tile_size: int = 256,
+                        image_format: str = 'WEBP') -> dict:
+    """将预览图像导出为 {z}/{x}/{y} 结构的瓦片金字塔
+
+    最大层级为预览原始分辨率, 每降低一级尺寸减半, 第0级为一张瓦片;
+    output_dir 下的 tiles.json 记录图像尺寸、瓦片大小与层级, 供前端查看器使用
+
+    Args:
+        image: (行, 列, 4)的uint8 RGBA数组
+        output_dir: 输出目录
+        tile_size: 瓦片边长
+        image_format: 瓦片格式, 如 'WEBP' 或 'PNG'
+
+    Returns:
+        瓦片金字塔元数据
+    """
+    create_dir_if_not_exists(output_dir)
+    height, width = image.shape[:2]
+    max_zoom = int(np.ceil(np.log2(max(width, height) / tile_size))) if max(width, height) > tile_size else 0
+    extension = image_format.lower()
+
+    level = Image.fromarray(image, mode='RGBA')
+    for zoom in range(max_zoom, -1, -1):
+        level_width, level_height = level.size
+        for x in range(0, level_width, tile_size):
+            tile_dir = os.path.join(output_dir, str(zoom), str(x // tile_size))
+            create_dir_if_not_exists(tile_dir)
+            for y in range(0, level_height, tile_size):
+                tile = level.crop((x, y, min(x + tile_size, level_width), min(y + tile_size, level_height)))
+                tile.save(os.path.join(tile_dir, f"{y // tile_size}.{extension}"), format=image_format, lossless=True)
+        if zoom > 0:
+            level = level.reduce(2)
+
+    metadata = {
+        'width': width,
+        'height': height,
+        'tile_size': tile_size,
+        'min_zoom': 0,
+        'max_zoom': max_zoom,
+        'format': extension,
+    }
+    with open(os.path.join(output_dir, 'tiles.json'), 'w') as json_file:
+        json.dump(metadata, json_file, indent=4)
+    return metadata
+
+
+def write_index_rasters(raster_paths: List[Tuple[str, str]], index_names: List[str], output_dir: str,
+                        chunk_size: int = 1024, workers: int = 4, block_size: int = 512,
+                        compress: str = 'deflate', **evaluate_kwargs) -> Dict[str, str]:
+    """按分块计算整块田的植被指数栅格, 保存为分块压缩的云优化GeoTIFF(COG)
+
+    底图名与 MultiRasterAnalyzer 一致, 指数公式见 utils/index_utils.py 中的 INDEX_EXPRESSIONS.
+    整幅底图划分为与输出分块对齐的窗口, 由线程池并行读取并计算, 每个线程持有自己的底图句柄,
+    主线程按顺序写入临时GeoTIFF, 同时在途的窗口数有上限, 峰值内存与分块大小成正比而与底图尺寸无关;
+    全部写完后再由GDAL的COG驱动生成金字塔并转换为COG. 任一所用底图为无效值的像素输出NaN
+
+    Args:
+        raster_paths: 底图文件路径列表, 如 [('red', 'red.tif'), ('nir', 'nir.tif')]
+        index_names: 指数名列表
+        output_dir: 输出目录, 每个指数保存为 output_dir/指数名.tif
+        chunk_size: 计算窗口的边长(像素), 会对齐到 block_size
+        workers: 计算线程数
+        block_size: 输出文件内部分块边长
+        compress: 压缩方式
+        **evaluate_kwargs: 传给 evaluate_indices 的参数, 如 nan/posinf/neginf
+
+    Returns:
+        {指数名: 输出文件路径}
+    """
+    paths = dict(raster_paths)
+    needed = required_rasters(index_names)
+    missing = [name for name in needed if name not in paths]
+    if missing:
+        raise ValueError(f"缺少计算指数所需的底图: {', '.join(missing)}")
+
+    # 所有底图必须网格一致, 窗口才能逐像素对齐
+    with rasterio.open(paths[needed[0]]) as reference:
+        crs, transform, height, width = reference.crs, reference.transform, reference.height, reference.width
+    for name in needed[1:]:
+        with rasterio.open(paths[name]) as src:
+            if src.crs != crs or src.transform != transform or src.shape != (height, width):
+                raise ValueError(f"底图{paths[name]}与{paths[needed[0]]}不完全重合")
+
+    chunk_size = max(block_size, chunk_size // block_size * block_size)
+    windows = [
+        Window(col, row, min(chunk_size, width - col), min(chunk_size, height - row))
+        for row in range(0, height, chunk_size)
+        for col in range(0, width, chunk_size)
+    ]
+
+    # 每个线程打开自己的底图句柄, 读取互不阻塞
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+
+    def compute(window: Window) -> Tuple[Window, Dict[str, np.ndarray]]:
+        if not hasattr(local, 'rasters'):
+            local.rasters = {name: rasterio.open(paths[name]) for name in needed}
+            with handles_lock:
+                handles.extend(local.rasters.values())
+        bands = {}
+        invalid = np.zeros((int(window.height), int(window.width)), dtype=bool)
+        for name, src in local.rasters.items():
+            data = src.read(window=window)
+            if src.nodata is not None:
+                invalid |= np.isnan(data).any(axis=0) if np.isnan(src.nodata) else (data == src.nodata).any(axis=0)
+            bands[name] = data[0] if src.count == 1 else data
+        indexs = evaluate_indices(bands, index_names, **evaluate_kwargs)
+        for index in indexs.values():
+            index[invalid] = np.nan
+        return window, indexs
+
+    create_dir_if_not_exists(output_dir)
+    profile = {
+        'driver': 'GTiff',
+        'dtype': 'float32',
+        'count': 1,
+        'height': height,
+        'width': width,
+        'crs': crs,
+        'transform': transform,
+        'nodata': np.nan,
+        'tiled': True,
+        'blockxsize': block_size,
+        'blockysize': block_size,
+        'compress': compress,
+        'BIGTIFF': 'IF_SAFER',
+    }
+    outputs = {name: os.path.join(output_dir, f"{name}.tif") for name in index_names}
+    tmp_paths = {name: f"{path}.{os.getpid()}.tmp.tif" for name, path in outputs.items()}
+
+    dsts = {}
+    try:
+        for name in index_names:
+            dsts[name] = rasterio.open(tmp_paths[name], 'w', **profile)
+
+        def write(result: Tuple[Window, Dict[str, np.ndarray]]) -> None:
+            window, indexs = result
+            for name, index in indexs.items():
+                dsts[name].write(index.astype(np.float32, copy=False), 1, window=window)
+
+        # 限制同时在途的窗口数, 避免计算结果堆积占用内存
+        max_pending = workers * 2
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='index-raster') as executor:
+            pending = deque()
+            for window in windows:
+                pending.append(executor.submit(compute, window))
+                if len(pending) >= max_pending:
+                    write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+
+        for dst in dsts.values():
+            dst.close()
+        for name in index_names:
+            rasterio.shutil.copy(tmp_paths[name], outputs[name], driver='COG',
+                                 compress=compress, blocksize=block_size, BIGTIFF='IF_SAFER')
+    finally:
+        for dst in dsts.values():
+            dst.close()
+        for src in handles:
+            src.close()
+        for path in tmp_paths.values():
+            if os.path.exists(path):
+                os.remove(path)
+    return outputs
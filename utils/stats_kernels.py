@@ -0,0 +1,79 @@
+import numpy as np
+from numba import njit
+
+
+# 本模块依赖numba, 未安装时导入失败, utils/stats_utils.py 会回退到NumPy实现
+
+
+@njit(cache=True, nogil=True)
+def clean_moments(index):
+    """一次遍历去除NaN并累加和, 再一次遍历累加二、三、四阶中心矩
+
+    排序不在内核中进行, NumPy的排序使用SIMD指令, 比numba编译的排序快得多
+
+    Args:
+        index: 一维指数数组
+
+    Returns:
+        (去除NaN后的数组, 均值, 二阶中心矩, 三阶中心矩, 四阶中心矩), 数组为空时矩为NaN
+    """
+    clean = np.empty(index.size, dtype=index.dtype)
+    n = 0
+    total = 0.0
+    for i in range(index.size):
+        value = index[i]
+        # NaN与自身不相等, 整型数组没有NaN
+        if value != value:
+            continue
+        clean[n] = value
+        total += value
+        n += 1
+    clean = clean[:n]
+    if n == 0:
+        return clean, np.nan, np.nan, np.nan, np.nan
+
+    mean = total / n
+    m2 = 0.0
+    m3 = 0.0
+    m4 = 0.0
+    for i in range(n):
+        deviation = clean[i] - mean
+        squared = deviation * deviation
+        m2 += squared
+        m3 += squared * deviation
+        m4 += squared * squared
+    return clean, mean, m2 / n, m3 / n, m4 / n
+
+
+@njit(cache=True, nogil=True)
+def histogram_peak(sorted_index, edges):
+    """在已排序数组上一次遍历统计各分箱计数, 返回计数最多的分箱序号
+
+    分箱规则与 np.histogram 一致: 除最后一个分箱为闭区间外均为左闭右开, 计数相同时取靠前的分箱
+
+    Args:
+        sorted_index: 已排序且不含NaN的一维数组
+        edges: 分箱边界, 首个边界不大于数组最小值
+
+    Returns:
+        分箱序号
+    """
+    num_bins = edges.size - 1
+    n = sorted_index.size
+    start = 0
+    j = 0
+    best_count = -1
+    best_bin = 0
+    for i in range(num_bins):
+        if i == num_bins - 1:
+            stop = n
+        else:
+            upper = edges[i + 1]
+            while j < n and sorted_index[j] < upper:
+                j += 1
+            stop = j
+        if stop - start > best_count:
+            best_count = stop - start
+            best_bin = i
+        start = stop
+    return best_bin
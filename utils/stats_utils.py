@@ -1,6 +1,19 @@
 import numpy as np
+import pandas as pd
 from scipy.stats import skew, kurtosis
 
+# 安装numba时使用编译的统计内核, 否则使用NumPy实现
+try:
+    from utils import stats_kernels
+except ImportError:
+    stats_kernels = None
+
+# 统计计算后端: NumPy向量化实现 / numba编译的融合循环
+STATS_BACKENDS = ('numpy', 'numba')
+
+# 默认后端, 安装numba时自动选用
+DEFAULT_STATS_BACKEND = 'numba' if stats_kernels is not None else 'numpy'
+
 def calculate_mean(indexs):
     """计算指数平均值"""
     return {f"avg_{name}": np.nanmean(index) for name, index in indexs.items()}
@@ -11,6 +24,9 @@ def calculate_std(indexs):
 
 def calculate_mode(indexs):
     """计算指数众数"""
+    if DEFAULT_STATS_BACKEND == 'numba':
+        # 编译内核在已排序数组上直接计数, 不再为自动分箱额外计算百分位数
+        return compute_all_stats(indexs, stats=['mode'])
     mode_index = {}
     for name, index in indexs.items():
         try:
@@ -127,3 +143,387 @@ def calculate_uniformity(indexs):
             uniform_index[f"uni_{name}"] = np.nan
     return uniform_index
     
+
+# compute_all_stats 支持的统计指标, 顺序与计算大全.py 中的调用顺序一致
+ALL_STATS = ['mean', 'std', 'mode', 'var', 'median', 'iqr', 'range', 'skew', 'kurt', 'cv', 'uni']
+
+# 各统计指标的结果键, 与 calculate_* 函数保持一致
+_STAT_KEYS = {
+    'mean': "avg_{}",
+    'std': "std_ff{}",
+    'mode': "mode_{}",
+    'var': "var_{}",
+    'median': "medi_{}",
+    'iqr': "iqr_{}",
+    'range': "rng_{}",
+    'skew': "skew_{}",
+    'kurt': "kurt_{}",
+    'cv': "var_{}",
+    'uni': "uni_{}",
+}
+
+def compute_all_stats(indexs, stats=None, backend=None):
+    """一次性计算指数的多项统计指标
+
+    每个指数只清洗一次NaN、排序一次, 由同一组中心矩得到均值/标准差/方差/偏度/峰度/变异系数/均匀度,
+    由排序结果得到中位数/四分位距/极差/众数. 返回的键与各 calculate_* 函数一致,
+    其中变异系数与方差同为 var_ 前缀, 与逐个合并 calculate_* 结果一样由靠后的指标覆盖
+
+    Args:
+        indexs: {指数名: 指数数组}
+        stats: 要计算的统计指标列表, 取值见 ALL_STATS, 为None时计算全部
+        backend: 计算后端, 取值见 STATS_BACKENDS, 为None时使用 DEFAULT_STATS_BACKEND;
+                 numba后端在两次遍历中完成NaN清洗与各阶矩, 众数直接在排序结果上计数
+
+    Returns:
+        {统计键: 值}
+    """
+    if stats is None:
+        stats = ALL_STATS
+    unknown = [stat for stat in stats if stat not in ALL_STATS]
+    if unknown:
+        raise ValueError(f"不支持的统计指标: {', '.join(unknown)}")
+    if backend is None:
+        backend = DEFAULT_STATS_BACKEND
+    if backend not in STATS_BACKENDS:
+        raise ValueError(f"统计计算后端必须是{'/'.join(STATS_BACKENDS)}之一")
+    if backend == 'numba' and stats_kernels is None:
+        raise ValueError("未安装numba, 无法使用numba后端")
+
+    result = {}
+    for name, index in indexs.items():
+        index = np.asarray(index).ravel()
+        # float16等numba不支持的类型使用NumPy实现
+        if backend == 'numba' and index.dtype.kind in 'fiu' and index.dtype != np.float16:
+            values = _describe_compiled(index, stats)
+        else:
+            values = _describe(index[~np.isnan(index)], stats)
+        for stat in stats:
+            result[_STAT_KEYS[stat].format(name)] = values[stat]
+    return result
+
+def _describe(clean_index, stats):
+    """计算单个已去除NaN的指数数组的统计指标"""
+    n = len(clean_index)
+    if n == 0:
+        return {stat: np.nan for stat in stats}
+
+    mean_val = np.mean(clean_index, dtype=np.float64)
+
+    # 中心矩, 与 scipy.stats.skew/kurtosis 的有偏估计一致
+    deviation = clean_index - mean_val
+    squared = deviation * deviation
+    m2 = np.mean(squared)
+    m3 = np.mean(squared * deviation) if 'skew' in stats else None
+    m4 = np.mean(squared * squared) if 'kurt' in stats else None
+
+    sorted_index = None
+    if {'mode', 'median', 'iqr', 'range'} & set(stats):
+        sorted_index = np.sort(clean_index)
+    return _summarize(n, mean_val, m2, m3, m4, sorted_index, clean_index.dtype, stats)
+
+def _describe_compiled(index, stats):
+    """使用numba内核计算单个指数数组(可含NaN)的统计指标, 结果与 _describe 一致"""
+    need_sort = bool({'mode', 'median', 'iqr', 'range'} & set(stats))
+    clean_index, mean_val, m2, m3, m4 = stats_kernels.clean_moments(index)
+    n = len(clean_index)
+    if n == 0:
+        return {stat: np.nan for stat in stats}
+    if need_sort:
+        # clean_index 为内核新分配的数组, 可原地排序
+        clean_index.sort()
+    return _summarize(n, mean_val, m2, m3, m4, clean_index if need_sort else None, index.dtype, stats,
+                      compiled=True)
+
+def _summarize(n, mean_val, m2, m3, m4, sorted_index, dtype, stats, compiled=False):
+    """由样本数、中心矩与排序结果得到各统计指标"""
+    values = {}
+    std_val = np.sqrt(m2)
+    values['mean'] = mean_val
+    values['std'] = std_val
+    values['var'] = m2
+
+    if 'skew' in stats or 'kurt' in stats:
+        # 与scipy相同, 方差相对均值可忽略时视为常数数组
+        eps = np.finfo(np.result_type(dtype, np.float16)).eps
+        constant = m2 <= (eps * mean_val) ** 2
+        if 'skew' in stats:
+            if n < 3 or constant:
+                values['skew'] = np.nan
+            else:
+                values['skew'] = m3 / m2 ** 1.5
+        if 'kurt' in stats:
+            if n < 4 or constant:
+                values['kurt'] = np.nan
+            else:
+                values['kurt'] = m4 / m2 ** 2 - 3
+
+    if mean_val == 0:
+        values['cv'] = 0
+        values['uni'] = 1
+    else:
+        values['cv'] = std_val / mean_val
+        values['uni'] = np.clip(1 - std_val / mean_val, 0, 1)
+
+    if sorted_index is not None:
+        if np.issubdtype(sorted_index.dtype, np.integer):
+            # 整型在原类型中求差会溢出
+            values['range'] = np.int64(sorted_index[-1]) - np.int64(sorted_index[0])
+        else:
+            values['range'] = sorted_index[-1] - sorted_index[0]
+        values['median'] = _sorted_percentile(sorted_index, 50)
+        values['iqr'] = _sorted_percentile(sorted_index, 75) - _sorted_percentile(sorted_index, 25)
+        if 'mode' in stats:
+            try:
+                # 分箱数由已得到的四分位距与极差确定, 不再重新计算百分位数;
+                # 整型的四分位距按浮点数计算, 不会像 np.percentile 那样在原类型中溢出
+                bins = _auto_bin_edges(sorted_index, values['iqr'])
+                if compiled:
+                    values['mode'] = bins[stats_kernels.histogram_peak(sorted_index, bins)]
+                else:
+                    # 已排序数据可直接用二分查找得到各分箱计数
+                    bounds = np.searchsorted(sorted_index, bins, side='left')
+                    bounds[-1] = n
+                    values['mode'] = bins[np.argmax(np.diff(bounds))]
+            except Exception:
+                values['mode'] = np.nan
+
+    return values
+
+def _auto_bin_edges(sorted_index, iqr):
+    """由已排序数组的四分位距与极差得到与 np.histogram_bin_edges(bins='auto') 相同的分箱边界
+
+    分箱宽度取 Freedman-Diaconis 与 Sturges 估计中的较小者 (FD 估计下限为平方根估计的一半)
+    """
+    n = sorted_index.size
+    integer = np.issubdtype(sorted_index.dtype, np.integer)
+    first_val = sorted_index[0]
+    last_val = sorted_index[-1]
+    # 整型的差按无符号计算, 避免溢出
+    ptp = int(last_val) - int(first_val) if integer else last_val - first_val
+    fd_bw = 2.0 * iqr * n ** (-1.0 / 3.0)
+    sturges_bw = ptp / (np.log2(n) + 1.0)
+    sqrt_bw = ptp / np.sqrt(n)
+    width = min(max(fd_bw, sqrt_bw / 2), sturges_bw)
+
+    first_edge, last_edge = first_val, last_val
+    if first_edge == last_edge:
+        first_edge = first_edge - 0.5
+        last_edge = last_edge + 0.5
+        delta = last_edge - first_edge
+    else:
+        delta = ptp
+    if width:
+        if integer and width < 1:
+            width = 1
+        num_bins = int(np.ceil(delta / width))
+    else:
+        num_bins = 1
+    # 给定分箱数与范围时不再扫描数据, 边界的类型与计算方式与自动分箱相同
+    return np.histogram_bin_edges(sorted_index, bins=num_bins, range=(first_edge, last_edge))
+
+def _sorted_percentile(sorted_index, q):
+    """在已排序数组上按 np.percentile 默认的线性插值计算百分位数"""
+    n = len(sorted_index)
+    position = (n - 1) * (q / 100)
+    lower = int(np.floor(position))
+    upper = min(lower + 1, n - 1)
+    gamma = position - lower
+    a = sorted_index[lower]
+    b = sorted_index[upper]
+    if np.issubdtype(sorted_index.dtype, np.integer):
+        # 整型在原类型中求差会溢出, 插值结果本就是浮点数
+        a = np.float64(a)
+        b = np.float64(b)
+    diff = b - a
+    if gamma >= 0.5:
+        return b - diff * (1 - gamma)
+    return a + diff * gamma
+
+def compute_batch_stats(indexs, offsets=None, labels=None, fids=None, stats=None):
+    """批量计算多个区块的统计指标
+
+    像素按区块拼接为一维数组, 通过 offsets 或 labels 划分区块, 使用分段归约
+    (np.add.reduceat) 与分段排序一次性得到所有区块的统计指标, 不逐区块循环.
+    结果键与 compute_all_stats 一致
+
+    Args:
+        indexs: {指数名: 一维像素数组}, 所有数组长度与像素顺序相同
+        offsets: 区块在像素数组中的起止位置, 长度为区块数+1
+        labels: 每个像素所属的区块ID, 与 offsets 二选一
+        fids: 区块ID数组; 使用 offsets 时与区块一一对应, 默认为 0..区块数-1;
+              使用 labels 时指定输出的区块及顺序, 默认为 labels 中出现的全部ID
+        stats: 要计算的统计指标列表, 取值见 ALL_STATS, 为None时计算全部
+
+    Returns:
+        每个区块一行的数据框, 包含 FID 列与各统计键列
+    """
+    if stats is None:
+        stats = ALL_STATS
+    unknown = [stat for stat in stats if stat not in ALL_STATS]
+    if unknown:
+        raise ValueError(f"不支持的统计指标: {', '.join(unknown)}")
+
+    # 将像素映射为区块序号
+    if offsets is not None:
+        offsets = np.asarray(offsets, dtype=np.int64)
+        num_segments = len(offsets) - 1
+        segments = np.repeat(np.arange(num_segments), np.diff(offsets))
+        if fids is None:
+            fids = np.arange(num_segments)
+    elif labels is not None:
+        labels = np.asarray(labels).ravel()
+        if fids is None:
+            fids = np.unique(labels)
+        fids = np.asarray(fids)
+        num_segments = len(fids)
+        order = np.argsort(fids, kind='stable')
+        position = np.searchsorted(fids, labels, sorter=order)
+        position = np.minimum(position, num_segments - 1) if num_segments else position
+        segments = order[position] if num_segments else position
+        # 不在fids中的像素不参与统计
+        known = fids[segments] == labels if num_segments else np.zeros(len(labels), dtype=bool)
+        segments = np.where(known, segments, -1)
+    else:
+        raise ValueError("必须提供offsets或labels参数")
+
+    table = {'FID': np.asarray(fids)}
+    for name, index in indexs.items():
+        values = _describe_segments(np.asarray(index).ravel(), segments, num_segments, stats)
+        for stat in stats:
+            table[_STAT_KEYS[stat].format(name)] = values[stat]
+    return pd.DataFrame(table)
+
+def _describe_segments(index, segments, num_segments, stats):
+    """按区块序号分段计算统计指标"""
+    keep = ~np.isnan(index) & (segments >= 0)
+    values = index[keep]
+    segments = segments[keep]
+
+    # 按区块分组; 需要分位数或众数时组内再按值排序
+    if {'mode', 'median', 'iqr', 'range'} & set(stats):
+        order = np.argsort(values)
+        order = order[np.argsort(segments[order], kind='stable')]
+    else:
+        order = np.argsort(segments, kind='stable')
+    values = values[order]
+    segments = segments[order]
+
+    counts = np.bincount(segments, minlength=num_segments)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    nonempty = counts > 0
+    seg_starts = starts[nonempty]
+    n = counts[nonempty].astype(np.float64)
+
+    result = {stat: np.full(num_segments, np.nan) for stat in ALL_STATS}
+    if len(values) == 0:
+        return result
+
+    def segment_sum(x):
+        return np.add.reduceat(x, seg_starts)
+
+    mean_val = segment_sum(values.astype(np.float64)) / n
+    deviation = values - np.repeat(mean_val, counts[nonempty])
+    squared = deviation * deviation
+    m2 = segment_sum(squared) / n
+    std_val = np.sqrt(m2)
+    result['mean'][nonempty] = mean_val
+    result['std'][nonempty] = std_val
+    result['var'][nonempty] = m2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        eps = np.finfo(np.result_type(index.dtype, np.float16)).eps
+        constant = m2 <= (eps * mean_val) ** 2
+        if 'skew' in stats:
+            skew_val = segment_sum(squared * deviation) / n / m2 ** 1.5
+            result['skew'][nonempty] = np.where((n < 3) | constant, np.nan, skew_val)
+        if 'kurt' in stats:
+            kurt_val = segment_sum(squared * squared) / n / m2 ** 2 - 3
+            result['kurt'][nonempty] = np.where((n < 4) | constant, np.nan, kurt_val)
+
+        zero_mean = mean_val == 0
+        ratio = std_val / mean_val
+        result['cv'][nonempty] = np.where(zero_mean, 0, ratio)
+        result['uni'][nonempty] = np.where(zero_mean, 1, np.clip(1 - ratio, 0, 1))
+
+    if not {'mode', 'median', 'iqr', 'range'} & set(stats):
+        return result
+
+    ends = seg_starts + counts[nonempty] - 1
+    first_val = values[seg_starts]
+    last_val = values[ends]
+    if np.issubdtype(values.dtype, np.integer):
+        # 整型在原类型中求差会溢出, 如 int8 的 -100..100
+        first_val = first_val.astype(np.int64)
+        last_val = last_val.astype(np.int64)
+    result['range'][nonempty] = last_val - first_val
+
+    def segment_percentile(q):
+        position = (n - 1) * (q / 100)
+        lower = np.floor(position)
+        gamma = position - lower
+        lower = seg_starts + lower.astype(np.int64)
+        upper = np.minimum(lower + 1, ends)
+        a = values[lower]
+        b = values[upper]
+        if np.issubdtype(values.dtype, np.integer):
+            a = a.astype(np.float64)
+            b = b.astype(np.float64)
+        diff = b - a
+        return np.where(gamma >= 0.5, b - diff * (1 - gamma), a + diff * gamma)
+
+    q1 = segment_percentile(25)
+    q3 = segment_percentile(75)
+    result['median'][nonempty] = segment_percentile(50)
+    result['iqr'][nonempty] = q3 - q1
+
+    if 'mode' in stats:
+        result['mode'][nonempty] = _segment_histogram_mode(
+            values, counts[nonempty], seg_starts, n, first_val, last_val, q3 - q1,
+            np.issubdtype(index.dtype, np.integer)
+        )
+
+    return result
+
+def _segment_histogram_mode(values, counts, starts, n, first_val, last_val, iqr, integer):
+    """分段计算与 np.histogram(bins='auto') 一致的直方图众数
+
+    分箱宽度取 Freedman-Diaconis 与 Sturges 估计中的较小者 (FD 估计下限为平方根估计的一半),
+    众数为计数最多的分箱左边界
+    """
+    ptp = last_val - first_val
+    fd_bw = 2.0 * iqr * n ** (-1.0 / 3.0)
+    sturges_bw = ptp / (np.log2(n) + 1.0)
+    sqrt_bw = ptp / np.sqrt(n)
+    width = np.minimum(np.maximum(fd_bw, sqrt_bw / 2), sturges_bw)
+    if integer:
+        width = np.where((width > 0) & (width < 1), 1, width)
+
+    same = first_val == last_val
+    first_edge = np.where(same, first_val - 0.5, first_val).astype(np.float64)
+    last_edge = np.where(same, last_val + 0.5, last_val).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        num_bins = np.where(width > 0, np.ceil((last_edge - first_edge) / width), 1).astype(np.int64)
+    step = (last_edge - first_edge) / num_bins
+
+    # 与 np.histogram 相同: 先按比例计算分箱, 再用实际分箱边界修正
+    seg = np.repeat(np.arange(len(counts)), counts)
+    seg_bins = num_bins[seg]
+    indices = ((values - first_edge[seg]) * (seg_bins / (last_edge - first_edge)[seg])).astype(np.int64)
+    indices = np.clip(indices, 0, seg_bins - 1)
+
+    def edge(i, s):
+        return np.where(i == num_bins[s], last_edge[s], i * step[s] + first_edge[s])
+
+    indices -= values < edge(indices, seg)
+    indices += (values >= edge(indices + 1, seg)) & (indices != seg_bins - 1)
+
+    # 各区块分箱在全局计数数组中的偏移
+    bin_offsets = np.concatenate(([0], np.cumsum(num_bins)[:-1]))
+    hist = np.bincount(bin_offsets[seg] + indices, minlength=int(num_bins.sum()))
+    bin_segments = np.repeat(np.arange(len(counts)), num_bins)
+    peak = np.maximum.reduceat(hist, bin_offsets)
+    first_peak = np.flatnonzero(hist == peak[bin_segments])
+    _, first = np.unique(bin_segments[first_peak], return_index=True)
+    peak_bin = first_peak[first] - bin_offsets
+    return edge(peak_bin, np.arange(len(counts)))
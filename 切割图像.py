@@ -1,8 +1,8 @@
 import os
-import rasterio
 
 from core.multi_raster_analyzer import MultiRasterAnalyzer
 from utils.file_utils import create_dir_if_not_exists
+from utils.image_writer import ImageWriter
 
 
 def main():
@@ -19,41 +19,35 @@ def main():
         analyzer = MultiRasterAnalyzer(shp_path, tif_paths)
         print(f"成功加载 {len(tif_paths)} 个栅格文件和 1 个shapefile")
         
-        # 提取区块图像为TIFF文件
+        # 提取区块图像为TIFF文件, 编码与写入在后台线程中进行
         print("开始提取区块图像数据...")
-        for tile_id, tile_data in analyzer.iterate_tiles():
-            # 为每个区块创建子目录
-            tile_dir = os.path.join(r'2024苏家屯\20240628\tile', f"tile_{tile_id}")
-            create_dir_if_not_exists(tile_dir)
-            
-            for name, data in tile_data.items():
-                # 构建输出文件路径
-                output_path = os.path.join(tile_dir, f"{name}.tif")
+        tile_geoms = analyzer.tiles.geometry.values
+        with ImageWriter(workers=4) as writer:
+            for tile_geom, (tile_id, tile_data) in zip(tile_geoms, analyzer.iterate_tiles()):
+                # 为每个区块创建子目录
+                tile_dir = os.path.join(r'2024苏家屯\20240628\tile', f"tile_{tile_id}")
+                create_dir_if_not_exists(tile_dir)
                 
-                # 获取第一个底图的元数据
-                first_raster = next(iter(analyzer.rasters.values()))
-                meta = first_raster.meta.copy()
-                # 获取当前图块的边界
-                tile_bounds = analyzer.tiles[analyzer.tiles['FID'] == int(tile_id)].geometry.iloc[0].bounds
-
-                
-                # 更新元数据
-                meta.update({
-                    'driver': 'GTiff',
-                    'height': data.shape[1],
-                    'width': data.shape[2],
-                    'transform': rasterio.windows.transform(
-                        rasterio.windows.from_bounds(
-                        *tile_bounds,
-                        first_raster.transform
-                    ),
-                    first_raster.transform
-                    )
-                })
-                
-                # 写入文件
-                with rasterio.open(output_path, 'w', **meta) as dst:
-                    dst.write(data)
+                for name, data in tile_data.items():
+                    # 构建输出文件路径
+                    output_path = os.path.join(tile_dir, f"{name}.tif")
+                    
+                    # 获取底图的元数据
+                    raster = analyzer.rasters[name]
+                    meta = raster.meta.copy()
+                    # 获取当前图块对齐到像素网格的窗口, 与提取像素时使用的窗口一致
+                    window = MultiRasterAnalyzer._tile_window(raster, tile_geom)
+                    
+                    # 更新元数据
+                    meta.update({
+                        'driver': 'GTiff',
+                        'height': data.shape[1],
+                        'width': data.shape[2],
+                        'transform': raster.window_transform(window)
+                    })
+                    
+                    # 提交写入任务
+                    writer.submit_geotiff(output_path, data, meta)
         
         success = True
     except Exception as e:
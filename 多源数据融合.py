@@ -1,4 +1,5 @@
 from core.data_integrator import DataIntegrator
+from utils.cache_utils import DEFAULT_CACHE_DIR
 
 
 
@@ -14,7 +15,12 @@ def main():
     
     try:
         # 初始化数据集成器
-        integrator = DataIntegrator(tile_id_field='FID') # 区块ID字段名
+        integrator = DataIntegrator(
+            tile_id_field='FID', # 区块ID字段名
+            lazy=True, # 合并时才读取数据
+            cache_dir=DEFAULT_CACHE_DIR, # 解析结果缓存目录, 文件未变化时不再重复解析, 为None时不缓存
+            conflict_policy='keep_first', # 字段冲突处理策略: keep_first/keep_last/suffix/coalesce/priority
+        )
 
         print("数据集成器初始化成功")
         
@@ -39,6 +45,7 @@ def main():
         output.append((r'2024苏家屯\20240628\result.geojson', 'geojson'))
         output.append((r'2024苏家屯\20240628\result.xlsx', 'excel'))
         output.append((r'2024苏家屯\20240628\result.shp', 'shp'))
+        output.append((r'2024苏家屯\20240628\result.parquet', 'parquet')) # 列式存储, 字段名不受10个字符限制, 读取速度快
 
         for output_path, output_type in output:
             success = integrator.export_data(output_path, output_type)
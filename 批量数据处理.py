@@ -1,24 +1,38 @@
 from asyncio import taskgroups
 import os
+import time
 import numpy as np
 import rasterio
-from rasterio.enums import Resampling
 from PIL import Image
 import json
-from core.multi_raster_analyzer import MultiRasterAnalyzer
+from core.plot_pipeline import CutStage, IndexStage, PlotPipeline
 from utils.file_utils import create_dir_if_not_exists
+from utils.index_utils import required_rasters
+from utils.manifest_utils import is_stage_current, load_manifest, record_stage, save_manifest, stage_signature
+from utils.raster_utils import ensure_overviews, export_tile_pyramid, get_preview_shape, render_preview, resample_raster, write_index_rasters
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 
-def process_data_folder(data_folder, folder_name, output_base_dir=None, tasks=None):
+def process_data_folder(data_folder, folder_name, output_base_dir=None, tasks=None, memory_budget_mb=512,
+                        build_overviews=True, preview_format='webp', scale_factor=0.5, incremental=True,
+                        write_resampled=False):
     """处理单个数据文件夹中的所有tif和shp文件
     
     参数:
         data_folder: 输入数据文件夹路径
         folder_name: 文件夹名称
         output_base_dir: 输出基础目录
-        tasks: 要执行的任务列表，可选值: ['resample', 'cut', 'calculate']
-               如果为None，则执行所有任务
+        tasks: 要执行的任务列表，可选值: ['resample', 'cut', 'calculate', 'index_map']
+               如果为None，则执行 resample、cut 与 calculate
+               'index_map' 输出整块田的NDVI/EXG云优化GeoTIFF, 用于质检制图
+        memory_budget_mb: 重采样与切割/计算时单个条带的内存预算(MB)
+        build_overviews: 是否为底图生成(或复用)金字塔, 预览直接从对应金字塔层读取
+        preview_format: 预览输出格式, 'webp' 输出单张WEBP, 'tiles' 输出 {z}/{x}/{y} 瓦片金字塔
+        scale_factor: 预览的缩放因子
+        incremental: 是否增量处理, 输出目录下的 manifest.json 记录各步骤的输入指纹、参数与输出指纹,
+               输入、参数与输出均未变化的步骤直接跳过
+        write_resampled: 是否同时按条带输出重采样后的GeoTIFF, 输出路径与原图相同时改名为 名称_resampled.tif, 不覆盖原图
     """
     print(f"处理数据文件夹: {data_folder}")
     
@@ -54,6 +68,11 @@ def process_data_folder(data_folder, folder_name, output_base_dir=None, tasks=No
         print(f"警告: 在 {data_folder} 中未找到任何tif文件，跳过此文件夹")
         return False
     
+    # 读取处理清单
+    create_dir_if_not_exists(output_base_dir)
+    manifest = load_manifest(output_base_dir)
+    shp_inputs = [shp_path]
+    
     try:
     
         # 任务1: 处理所有存在的TIFF文件
@@ -64,32 +83,37 @@ def process_data_folder(data_folder, folder_name, output_base_dir=None, tasks=No
             create_dir_if_not_exists(resampled_output_dir)
             
             # 遍历所有存在的TIFF文件
+            resample_params = {'scale_factor': scale_factor, 'build_overviews': build_overviews, 'preview_format': preview_format,
+                               'write_resampled': write_resampled}
             for name, path in existing_tif_files:
+                resample_stage = f'resample:{name}'
+                if incremental and is_stage_current(manifest, resample_stage, stage_signature([path], resample_params)):
+                    print(f"  {name}文件的预览已是最新，跳过")
+                    continue
                 try:
                     # 定义重采样后的文件路径
                     resampled_file_path = os.path.join(resampled_output_dir, f'{name}.tif')
+                    if os.path.abspath(resampled_file_path) == os.path.abspath(path):
+                        # 输出目录默认就是输入目录, 不能覆盖原图
+                        resampled_file_path = os.path.join(resampled_output_dir, f'{name}_resampled.tif')
                     
                     print(f"  正在重采样{name}文件...")
                     
+                    # 生成或复用金字塔, 预览读取开销与输出尺寸成正比
+                    if build_overviews:
+                        factors = ensure_overviews(path)
+                        if factors:
+                            print(f"    金字塔层级: {factors}")
+                        else:
+                            print("    ⚠️ 未能生成金字塔(底图目录可能只读)，按原图重采样读取")
+                    
                     # 打开原始图像
                     with rasterio.open(path) as src:
-                        # 定义重采样因子（缩小为原来的1/2）
-                        scale_factor = 0.5
-                        
+                        # 重采样因子默认为0.5（缩小为原来的1/2）
                         # 计算新的尺寸
                         new_height = int(src.height * scale_factor)
                         new_width = int(src.width * scale_factor)
                         
-                        # 读取并重采样所有波段
-                        data = src.read(
-                            out_shape=(
-                                src.count,
-                                new_height,
-                                new_width
-                            ),
-                            resampling=Resampling.bilinear
-                        )
-                        
                         # 计算新的transform
                         # 使用scale方法确保正确的地理配准
                         new_transform = src.transform * src.transform.scale(
@@ -113,19 +137,12 @@ def process_data_folder(data_folder, folder_name, output_base_dir=None, tasks=No
                         print(f"    原始Transform: {src.transform}")
                         print(f"    新Transform: {new_transform}")
                         
-                        # 写入重采样后的文件
-                        # with rasterio.open(resampled_file_path, 'w', **meta) as dst:
-                        #     dst.write(data)
-                        
-                        # # 验证输出文件的地理信息
-                        # with rasterio.open(resampled_file_path) as verify:
-                        #     if verify.crs is None:
-                        #         print(f"    ⚠️ 警告: CRS丢失!")
-                        #     else:
-                        #         print(f"    ✅ 验证 - 输出CRS: {verify.crs}")
-                        #         print(f"    ✅ 验证 - 输出范围: {verify.bounds}")
-                        
-                        # verify = meta
+                        # 按条带重采样并逐条带写入, 峰值内存受 memory_budget_mb 限制
+                        stage_outputs = []
+                        if write_resampled:
+                            resample_raster(src, resampled_file_path, (new_height, new_width), memory_budget_mb)
+                            stage_outputs.append(resampled_file_path)
+                            print(f"    ✅ 保存重采样图像到: {resampled_file_path}")
 
                         # 获取bounds信息
                         bounds = {
@@ -144,76 +161,36 @@ def process_data_folder(data_folder, folder_name, output_base_dir=None, tasks=No
                             json.dump(bounds, json_file, indent=4)
                         print(f"    ✅ 保存bounds信息到: {bounds_json_path}")
                         
-                        # 输出WEBP文件
-                        webp_output_path = os.path.join(resampled_output_dir, f'{name}.webp')
-                        
-                        # 读取数据并转换为适合PIL的格式
-                        data_for_webp = data.astype(np.float32)
-                        
-                        # 处理多波段数据
-                        if data_for_webp.shape[0] == 1:  # 单波段
-                            # 归一化到0-255范围
-                            data_norm = ((data_for_webp[0] - np.nanmin(data_for_webp[0])) / 
-                                        (np.nanmax(data_for_webp[0]) - np.nanmin(data_for_webp[0])) * 255)
-                            data_norm = np.nan_to_num(data_norm, nan=0).astype(np.uint8)
-                            # 创建RGBA图像，设置透明背景
-                            img = Image.fromarray(data_norm, mode='L').convert('RGBA')
-                            # 将0值（原NaN值）设置为完全透明
-                            alpha_channel = np.where(data_norm == 0, 0, 255).astype(np.uint8)
-                            img.putalpha(Image.fromarray(alpha_channel, mode='L'))
-                        elif data_for_webp.shape[0] >= 3:  # 多波段，取前3个作为RGB
-                            # 选择前3个波段
-                            rgb_bands = data_for_webp[:3, :, :]
-                            
-                            # 归一化每个波段到0-255范围
-                            rgb_normalized = np.zeros_like(rgb_bands, dtype=np.uint8)
-                            for i in range(3):
-                                band_data = rgb_bands[i]
-                                if np.nanmax(band_data) > np.nanmin(band_data):
-                                    band_norm = ((band_data - np.nanmin(band_data)) / 
-                                               (np.nanmax(band_data) - np.nanmin(band_data)) * 255)
-                                    rgb_normalized[i] = np.nan_to_num(band_norm, nan=0).astype(np.uint8)
-                                else:
-                                    rgb_normalized[i] = np.zeros_like(band_data, dtype=np.uint8)
-                            
-                            # 转换形状从 (bands, height, width) 到 (height, width, bands)
-                            rgb_image = np.transpose(rgb_normalized, (1, 2, 0))
-                            # 创建RGBA图像，设置透明背景
-                            img = Image.fromarray(rgb_image, mode='RGB').convert('RGBA')
-                            # 检测黑色像素（所有通道都为0）并设置为透明
-                            r, g, b, a = img.split()
-                            black_mask = (np.array(r) == 0) & (np.array(g) == 0) & (np.array(b) == 0)
-                            alpha_array = np.array(a)
-                            alpha_array[black_mask] = 0  # 将黑色像素设置为透明
-                            img.putalpha(Image.fromarray(alpha_array, mode='L'))
-                        else:
-                            # 其他情况，使用第一个波段
-                            data_norm = ((data_for_webp[0] - np.nanmin(data_for_webp[0])) / 
-                                        (np.nanmax(data_for_webp[0]) - np.nanmin(data_for_webp[0])) * 255)
-                            data_norm = np.nan_to_num(data_norm, nan=0).astype(np.uint8)
-                            # 创建RGBA图像，设置透明背景
-                            img = Image.fromarray(data_norm, mode='L').convert('RGBA')
-                            # 将0值（原NaN值）设置为完全透明
-                            alpha_channel = np.where(data_norm == 0, 0, 255).astype(np.uint8)
-                            img.putalpha(Image.fromarray(alpha_channel, mode='L'))
-                        
-                        # 保存WEBP文件
-                        # 检查图像尺寸是否超过WebP限制
-                        max_webp_size = 16383
-                        img_width, img_height = img.size
+                        # 单张WEBP受16383像素限制, 在读取前就确定预览尺寸, 只做一次重采样
+                        max_webp_size = 16383 if preview_format == 'webp' else None
+                        preview_shape = get_preview_shape(src, scale_factor, max_webp_size)
+                        if preview_shape != (new_height, new_width):
+                            print(f"    ⚠️ 图像尺寸({new_width}x{new_height})超过WebP限制，缩放到{preview_shape[1]}x{preview_shape[0]}")
                         
-                        if img_width > max_webp_size or img_height > max_webp_size:
-                            # 计算缩放比例，确保两个维度都小于限制
-                            scale = min(max_webp_size / img_width, max_webp_size / img_height)
-                            new_width = int(img_width * scale)
-                            new_height = int(img_height * scale)
-                            print(f"    ⚠️ 图像尺寸({img_width}x{img_height})超过WebP限制，缩放到{new_width}x{new_height}")
-                            img = img.resize((new_width, new_height), Image.Resampling.BILINEAR)
+                        # 逐条带重采样: 第一遍求全局最小/最大值, 第二遍归一化为RGBA
+                        # 单波段为灰度图且0值透明, 多波段取前3个作为RGB且黑色像素透明
+                        preview = render_preview(src, preview_shape, memory_budget_mb)
                         
-                        img.save(webp_output_path, format='WEBP', lossless=True)
+                    if preview_format == 'tiles':
+                        # 输出瓦片金字塔
+                        tiles_output_dir = os.path.join(resampled_output_dir, f'{name}_tiles')
+                        export_tile_pyramid(preview, tiles_output_dir)
+                        preview_output_path = os.path.join(tiles_output_dir, 'tiles.json')
+                        print(f"    ✅ 保存瓦片金字塔到: {tiles_output_dir}")
+                    else:
+                        # 输出WEBP文件
+                        webp_output_path = os.path.join(resampled_output_dir, f'{name}.webp')
+                        Image.fromarray(preview, mode='RGBA').save(webp_output_path, format='WEBP', lossless=True)
+                        preview_output_path = webp_output_path
                         print(f"    ✅ 保存WEBP图像到: {webp_output_path}")
+                    del preview
                     
-                    print(f"  成功处理{name}文件并保存为WEBP格式")
+                    # 金字塔生成后再记录输入指纹
+                    record_stage(manifest, resample_stage, stage_signature([path], resample_params),
+                                 stage_outputs + [bounds_json_path, preview_output_path])
+                    save_manifest(output_base_dir, manifest)
+                    
+                    print(f"  成功处理{name}文件并保存为{preview_format.upper()}格式")
                 except Exception as e:
                     print(f"  处理{name}文件时出错: {str(e)}")
                     import traceback
@@ -224,152 +201,102 @@ def process_data_folder(data_folder, folder_name, output_base_dir=None, tasks=No
         else:
             print("未找到任何需要处理的TIFF文件，跳过处理步骤")
         
+        # 任务2与任务3作为流水线步骤, 每个区块的像素只读取一次, 同时用于切割与指数计算
+        stages = []
+        band_names = [name for name, _ in existing_tif_files]
+        
         # 任务2: 按shp将rgb进行图像切割 (如果存在rgb文件)
+        cut_inputs = [os.path.join(data_folder, 'rgb.tif')] + shp_inputs
+        cut_params = {'folder_name': folder_name}
         if 'cut' in tasks:
-            has_rgb = any(name == 'rgb' for name, _ in existing_tif_files)
-            if has_rgb:
-                print("开始按shp切割RGB图像...")
+            has_rgb = 'rgb' in band_names
+            if has_rgb and incremental and is_stage_current(manifest, 'cut', stage_signature(cut_inputs, cut_params)):
+                print("RGB切割结果已是最新，跳过切割步骤")
+            elif has_rgb:
                 rgb_output_dir = Path(output_base_dir).parent / 'tiles'
                 create_dir_if_not_exists(rgb_output_dir)
-                
-                # 初始化只包含RGB的分析器
-                rgb_analyzer = MultiRasterAnalyzer(shp_path, [('rgb', os.path.join(data_folder, 'rgb.tif'))])
-                
-                for tile_id, tile_data in rgb_analyzer.iterate_tiles():
-                    # 构建输出文件路径
-                    output_path = os.path.join(rgb_output_dir, str(tile_id), f"{folder_name}.png")
-                    create_dir_if_not_exists(os.path.join(rgb_output_dir, str(tile_id)))
-                    
-                    # 获取RGB数据并转换为PIL格式
-                    # 数据格式为 (bands, height, width)，实际是4波段(RGBA)
-                    rgb_data = tile_data['rgb']
-                    
-                    # 数据已经是uint8类型，值范围在0-255之间，不需要归一化
-                    # 只取前3个波段(RGB)，忽略Alpha通道
-                    rgb_bands = rgb_data[:3, :, :]  # 取前3个波段
-                    
-                    # 转换形状从 (bands, height, width) 到 (height, width, bands)
-                    rgb_image = np.transpose(rgb_bands, (1, 2, 0))
-                    
-                    # 创建PIL图像并设置透明背景
-                    img = Image.fromarray(rgb_image, mode='RGB').convert('RGBA')
-                    # 检测黑色像素（所有通道都为0）并设置为透明
-                    r, g, b, a = img.split()
-                    black_mask = (np.array(r) == 0) & (np.array(g) == 0) & (np.array(b) == 0)
-                    alpha_array = np.array(a)
-                    alpha_array[black_mask] = 0  # 将黑色像素设置为透明
-                    img.putalpha(Image.fromarray(alpha_array, mode='L'))
-                    img.save(output_path, format='PNG', lossless=True)
-                    # print(f"成功将RGB图像按shp切割到: {rgb_output_dir} (PNG格式)")
-            
-        # 任务3: 计算指数并输出result_index.shp
-        # 初始化分析器
-        if 'calculate' in tasks:
-            has_required_bands = all(band in [name for name, _ in existing_tif_files] for band in ['red', 'nir', 'green'])
-
+                # 每个区块保存为 tiles/区块ID/文件夹名称.png
+                stages.append(CutStage(str(rgb_output_dir), folder_name))
+        
+        # 任务3: 计算指数并输出result_index.geojson
+        calculate_inputs = [path for name, path in existing_tif_files if name in ('red', 'green', 'nir', 'rgb')] + shp_inputs
+        calculate_params = {'indices': ['ndvi', 'exg'], 'mode': 'compact'}
+        run_calculate = False
+        if 'calculate' in tasks and incremental and is_stage_current(manifest, 'calculate', stage_signature(calculate_inputs, calculate_params)):
+            print("指数计算结果已是最新，跳过计算步骤")
+        elif 'calculate' in tasks:
+            has_required_bands = all(band in band_names for band in ['red', 'nir', 'green'])
             if not has_required_bands:
                 print("警告: 缺少计算NDVI所需的red和nir波段，无法计算这些指数")
-            else:    
-                index_tif_files = [item for item in existing_tif_files if item[0] in ['red', 'green', 'nir']]
-                analyzer_ms = MultiRasterAnalyzer(shp_path, index_tif_files)
+            else:
+                # 计算NDVI, 替换NaN和无穷大值
+                # 可追加 'osavi', 'gndvi' 等 utils/index_utils.py 中注册的指数
+                stages.append(IndexStage(['ndvi'], _summarize_ms_indices, name='ms',
+                                         nan=0.0, posinf=1.0, neginf=-1.0))
+                run_calculate = True
             
-            has_rgb_band = all(band in [name for name, _ in existing_tif_files] for band in ['rgb'])
+            has_rgb_band = 'rgb' in band_names
             if not has_rgb_band:
                 print("警告: 缺少计算RGB波段，无法计算这些指数")
             else:
-                analyzer_rgb = MultiRasterAnalyzer(shp_path, [item for item in existing_tif_files if item[0] == 'rgb'])
-
-            print(f"成功加载 {len(index_tif_files)+(1 if has_rgb_band else 0)} 个栅格文件和 1 个shapefile")
-            print("开始计算指数并生成result_index.shp...")
-            results = []
-            
-            iterator = {}
-
-            if has_required_bands:
-                for tile_id, tile_data in analyzer_ms.iterate_tiles():
-                    iterator[tile_id] = tile_data
-
-            if has_rgb_band:
-                for tile_id, tile_data in analyzer_rgb.iterate_tiles():
-                    if tile_id not in iterator:
-                        iterator[tile_id] = {}
-                    iterator[tile_id]['rgb'] = tile_data['rgb']
+                with rasterio.open(os.path.join(data_folder, 'rgb.tif')) as src:
+                    rgb_band_count = src.count
+                if rgb_band_count >= 3:
+                    # 假设RGB通道顺序为: 红(0), 绿(1), 蓝(2), 计算超绿指数EXG
+                    stages.append(IndexStage(['exg'], _summarize_rgb_indices, name='rgb'))
+                    run_calculate = True
+        
+        if stages:
+            pipeline = PlotPipeline(shp_path, existing_tif_files, stages)
+            loaded = sum(len(analyzer.rasters) for analyzer in pipeline.analyzers)
+            print(f"成功加载 {loaded} 个栅格文件和 1 个shapefile")
+            print(f"开始执行: {', '.join(stage.name for stage in stages)}")
+            # 按条带读取, 条带缓冲区受本文件夹的内存预算限制;
+            # 多光谱与RGB的区块按FID流式合并, 每个区块处理完即释放, 只保留标量结果
+            outputs = pipeline.run(plan='strip', memory_budget_mb=memory_budget_mb)
             
+            if 'cut' in outputs:
+                record_stage(manifest, 'cut', stage_signature(cut_inputs, cut_params), outputs['cut'])
+                save_manifest(output_base_dir, manifest)
             
-            for tile_id, tile_data in iterator.items():
-                # print(f"处理区块: {tile_id}")
-                result = {'FID': tile_id}
-
+            if run_calculate:
+                # 多光谱与RGB指数的结果按FID合并
+                results = outputs.get('ms', []) + outputs.get('rgb', [])
                 
-                if has_required_bands:
-                    red = tile_data['red']
-                    green = tile_data['green']
-                    nir = tile_data['nir']
-                    
-                    # 计算NDVI
-                    with np.errstate(divide='ignore', invalid='ignore'):
-                        ndvi = (nir - red) / (nir + red)
-                        # # 计算OSAVI (优化土壤调整植被指数)
-                        # osavi = (1 + 0.16) * (nir - red) / (nir + red + 0.16)
-                        # gndvi = (nir - green) / (nir + green)
-                        
-                    # 替换NaN和无穷大值
-                    ndvi = np.nan_to_num(ndvi, nan=0.0, posinf=1.0, neginf=-1.0)
-                    # osavi = np.nan_to_num(osavi, nan=0.0, posinf=1.0, neginf=-1.0)
-                    # gndvi = np.nan_to_num(gndvi, nan=0.0, posinf=1.0, neginf=-1.0)
-                    
-                    # 计算NDVI的均值和变异系数
-                    ndvi_mean = np.nanmean(ndvi)
-                    if ndvi_mean == 0:
-                        ndvi_cv = 0
-                    else:
-                        ndvi_cv = np.nanstd(ndvi) / ndvi_mean
-                    
-                    # # 计算OSAVI的均值和变异系数
-                    # osavi_mean = np.nanmean(osavi)
-                    # if osavi_mean == 0:
-                    #     osavi_cv = 0
-                    # else:
-                    #     osavi_cv = np.nanstd(osavi) / osavi_mean
-
-                    # # 计算GNDVI的均值和变异系数
-                    # gndvi_mean = np.nanmean(gndvi)
-                    # if gndvi_mean == 0:
-                    #     gndvi_cv = 0
-                    # else:
-                    #     gndvi_cv = np.nanstd(gndvi) / gndvi_mean
-                    
-                    # 添加到结果
-                    result['ndvi'] = ndvi_mean
-                    result['ndvi_cv'] = ndvi_cv
-                    result['lai'] = ndvi_mean * 10
-                    result['lai_cv'] = ndvi_cv * 10
-
-                    # result['osavi'] = osavi_mean
-                    # result['osavi_cv'] = osavi_cv
-                    # result['gndvi'] = gndvi_mean
-                    # result['gndvi_cv'] = gndvi_cv
-                
-                # 计算超绿指数EXG
-                if has_rgb_band:
-                    rgb_data = tile_data['rgb']
-                    if len(rgb_data.shape) >= 3 and rgb_data.shape[0] >= 3:
-                        # 假设RGB通道顺序为: 红(0), 绿(1), 蓝(2)
-                        rgb_r = rgb_data[0, :, :]
-                        rgb_g = rgb_data[1, :, :]
-                        rgb_b = rgb_data[2, :, :]
-                        
-                        # 计算超绿指数EXG
-                        exg = 2 * rgb_g - rgb_r - rgb_b
-                        exg_mean = np.nanmean(exg)
-                        result['exg'] = exg_mean
+                # 导出结果到geojson
+                result_geojson_path = os.path.join(output_base_dir, 'result_index.geojson')
+                pipeline.export_results_to_geojson(results, result_geojson_path)
+                print(f"成功导出结果到: {result_geojson_path}")
                 
-                results.append(result)
-            
-            # 导出结果到geojson
-            result_geojson_path = os.path.join(output_base_dir, 'result_index.geojson')
-            analyzer_rgb.export_results_to_geojson(results, result_geojson_path)
-            print(f"成功导出结果到: {result_geojson_path}")
+                record_stage(manifest, 'calculate', stage_signature(calculate_inputs, calculate_params), [result_geojson_path])
+                save_manifest(output_base_dir, manifest)
+            pipeline.close()
+        
+        # 任务4: 输出整块田的指数栅格
+        if 'index_map' in tasks:
+            index_map_dir = os.path.join(output_base_dir, 'index_maps')
+            index_groups = []
+            if all(band in band_names for band in ['red', 'nir']):
+                index_groups.append(['ndvi'])
+            if 'rgb' in band_names:
+                with rasterio.open(os.path.join(data_folder, 'rgb.tif')) as src:
+                    if src.count >= 3:
+                        index_groups.append(['exg'])
+            if not index_groups:
+                print("警告: 缺少计算指数栅格所需的波段，跳过指数栅格步骤")
+            for index_names in index_groups:
+                # NDVI与EXG所用底图的分辨率不同, 分别输出
+                index_map_stage = f"index_map:{'+'.join(index_names)}"
+                index_map_inputs = [path for name, path in existing_tif_files if name in required_rasters(index_names)]
+                index_map_params = {'indices': index_names}
+                signature = stage_signature(index_map_inputs, index_map_params)
+                if incremental and is_stage_current(manifest, index_map_stage, signature):
+                    print(f"{', '.join(index_names)} 指数栅格已是最新，跳过")
+                    continue
+                outputs = write_index_rasters(existing_tif_files, index_names, index_map_dir)
+                print(f"成功输出指数栅格: {', '.join(outputs.values())}")
+                record_stage(manifest, index_map_stage, signature, list(outputs.values()))
+                save_manifest(output_base_dir, manifest)
         
         return True
     except Exception as e:
@@ -379,14 +306,73 @@ def process_data_folder(data_folder, folder_name, output_base_dir=None, tasks=No
         return False
 
 
-def batch_process_folders(root_folder = "2025丹东629", output_root_dir="2025dandong629", tasks=None):
+def _summarize_ms_indices(indexs):
+    """汇总多光谱指数: NDVI的均值和变异系数, 以及由其估算的LAI
+    
+    参数:
+        indexs: {指数名: 区块内像素数组}
+    
+    返回:
+        {字段名: 值}
+    """
+    ndvi = indexs['ndvi']
+    
+    # 计算NDVI的均值和变异系数
+    ndvi_mean = np.nanmean(ndvi)
+    if ndvi_mean == 0:
+        ndvi_cv = 0
+    else:
+        ndvi_cv = np.nanstd(ndvi) / ndvi_mean
+    
+    # # 计算OSAVI的均值和变异系数
+    # osavi_mean = np.nanmean(osavi)
+    # if osavi_mean == 0:
+    #     osavi_cv = 0
+    # else:
+    #     osavi_cv = np.nanstd(osavi) / osavi_mean
+    
+    return {
+        'ndvi': ndvi_mean,
+        'ndvi_cv': ndvi_cv,
+        'lai': ndvi_mean * 10,
+        'lai_cv': ndvi_cv * 10,
+        # 'osavi': osavi_mean,
+        # 'osavi_cv': osavi_cv,
+    }
+
+
+def _summarize_rgb_indices(indexs):
+    """汇总RGB指数: 超绿指数EXG的均值
+    
+    参数:
+        indexs: {指数名: 区块内像素数组}
+    
+    返回:
+        {字段名: 值}
+    """
+    return {'exg': np.nanmean(indexs['exg'])}
+
+
+def batch_process_folders(root_folder = "2025丹东629", output_root_dir="2025dandong629", tasks=None,
+                          workers=1, memory_budget_mb=512, report_path=None, incremental=True):
     """批量处理根文件夹下的所有子文件夹
     
+    各子文件夹互不依赖, workers 大于1时用进程池同时处理多个子文件夹;
+    每个子文件夹的结果与耗时汇总为报告, 写入 report_path 指定的JSON文件
+    
     参数:
         root_folder: 输入根文件夹路径
         output_root_dir: 输出根目录
-        tasks: 要执行的任务列表，可选值: ['resample', 'cut', 'calculate']
+        tasks: 要执行的任务列表，可选值: ['resample', 'cut', 'calculate', 'index_map']
                如果为None，则执行所有任务
+        workers: 同时处理的子文件夹数
+        memory_budget_mb: 每个子文件夹的内存预算(MB), 也可以是 {子文件夹名: 内存预算} 字典,
+               同时用作重采样条带预算与GDAL块缓存上限
+        report_path: 汇总报告路径, 为None时写入输出根目录(或输入根文件夹)下的 batch_report.json
+        incremental: 是否增量处理, 只重做输入、参数或输出有变化的步骤
+    
+    返回:
+        汇总报告
     """
     print(f"开始批量处理文件夹: {root_folder}")
     
@@ -397,7 +383,8 @@ def batch_process_folders(root_folder = "2025丹东629", output_root_dir="2025da
     print(f"将执行任务: {', '.join(tasks)}")
     
     # 遍历根文件夹下的所有子文件夹
-    for folder_name in os.listdir(root_folder):
+    jobs = []
+    for folder_name in sorted(os.listdir(root_folder)):
         folder_path = os.path.join(root_folder, folder_name)
         
         # 检查是否是目录
@@ -411,15 +398,93 @@ def batch_process_folders(root_folder = "2025丹东629", output_root_dir="2025da
             current_output_dir = os.path.join(output_root_dir, folder_name)
             create_dir_if_not_exists(current_output_dir)
         
-        # 处理当前文件夹
-        process_data_folder(folder_path, folder_name, current_output_dir, tasks)
+        if isinstance(memory_budget_mb, dict):
+            folder_budget = memory_budget_mb.get(folder_name, 512)
+        else:
+            folder_budget = memory_budget_mb
+        jobs.append((folder_path, folder_name, str(current_output_dir), tasks, folder_budget, incremental))
+    
+    start_time = time.time()
+    folders = []
+    if workers <= 1:
+        for job in jobs:
+            folders.append(_process_folder_job(job))
+    else:
+        print(f"使用 {workers} 个进程同时处理 {len(jobs)} 个文件夹")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_process_folder_job, job): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    folder = future.result()
+                except Exception as e:
+                    # 工作进程异常退出
+                    folder = {'folder': job[1], 'path': job[0], 'success': False, 'seconds': None, 'error': str(e)}
+                folders.append(folder)
+                print(f"[{len(folders)}/{len(jobs)}] {folder['folder']} {'完成' if folder['success'] else '失败'}")
+    folders.sort(key=lambda folder: folder['folder'])
     
-    print("批量处理完成")
+    report = {
+        'root_folder': str(root_folder),
+        'output_root_dir': None if output_root_dir is None else str(output_root_dir),
+        'tasks': tasks,
+        'workers': workers,
+        'total': len(folders),
+        'succeeded': sum(1 for folder in folders if folder['success']),
+        'failed': [folder['folder'] for folder in folders if not folder['success']],
+        'seconds': round(time.time() - start_time, 3),
+        'folders': folders,
+    }
+    
+    # 保存汇总报告
+    if report_path is None:
+        report_path = os.path.join(output_root_dir if output_root_dir is not None else root_folder, 'batch_report.json')
+    with open(report_path, 'w', encoding='utf-8') as json_file:
+        json.dump(report, json_file, indent=4, ensure_ascii=False)
+    
+    print(f"批量处理完成: 成功 {report['succeeded']}/{report['total']}, 用时 {report['seconds']} 秒")
+    if report['failed']:
+        print(f"处理失败的文件夹: {', '.join(report['failed'])}")
+    print(f"汇总报告已保存到: {report_path}")
+    return report
+
+
+def _process_folder_job(job):
+    """处理单个子文件夹并记录结果, 可在进程池中运行
+    
+    参数:
+        job: (输入文件夹路径, 文件夹名称, 输出目录, 任务列表, 内存预算, 是否增量处理)
+    
+    返回:
+        该子文件夹的处理结果
+    """
+    folder_path, folder_name, output_dir, tasks, memory_budget_mb, incremental = job
+    start_time = time.time()
+    error = None
+    try:
+        # 限制GDAL块缓存, 使每个子文件夹的内存占用受预算控制
+        with rasterio.Env(GDAL_CACHEMAX=max(1, int(memory_budget_mb))):
+            success = bool(process_data_folder(folder_path, folder_name, output_dir, tasks, memory_budget_mb,
+                                               incremental=incremental))
+    except Exception as e:
+        success = False
+        error = str(e)
+    if not success and error is None:
+        error = "处理失败或缺少输入文件, 详见日志"
+    return {
+        'folder': folder_name,
+        'path': folder_path,
+        'success': success,
+        'seconds': round(time.time() - start_time, 3),
+        'error': error,
+    }
 
 
 if __name__ == '__main__':
 
     tasks = ['resample', 'cut', 'calculate']
+    workers = 4 # 同时处理的文件夹数, 注意每个进程的内存占用
+    memory_budget_mb = 512 # 每个文件夹的内存预算(MB)
     
-    batch_process_folders(root_folder = "./input/2025丹东629", output_root_dir="./output/2025dandong629", tasks=tasks)
-    batch_process_folders(root_folder = "./input/2024苏家屯", output_root_dir="./output/2024sujiatun", tasks=tasks)
+    batch_process_folders(root_folder = "./input/2025丹东629", output_root_dir="./output/2025dandong629", tasks=tasks, workers=workers, memory_budget_mb=memory_budget_mb)
+    batch_process_folders(root_folder = "./input/2024苏家屯", output_root_dir="./output/2024sujiatun", tasks=tasks, workers=workers, memory_budget_mb=memory_budget_mb)
@@ -1,20 +1,7 @@
-import numpy as np
-
 from core.multi_raster_analyzer import MultiRasterAnalyzer
 
-from utils.stats_utils import (
-    calculate_mean,
-    calculate_std,
-    calculate_mode,
-    calculate_variance,
-    calculate_median,
-    calculate_iqr,
-    calculate_range,
-    calculate_skewness,
-    calculate_kurtosis,
-    calculate_coefficient_of_variation,
-    calculate_uniformity
-)
+from utils.index_utils import evaluate_indices, required_rasters
+from utils.stats_utils import compute_all_stats
 
 
 
@@ -36,7 +23,36 @@ def main():
         # ('swir2', r'2024苏家屯\20240628\swir2.tif'),  # 短波红外2波段TIF文件路径
     ]
     shp_path = r'2024苏家屯\20240628\shape.shp'  # 替换为实际的shapefile路径
+
+    # 要计算的植被指数, 公式见 utils/index_utils.py 中的 INDEX_EXPRESSIONS
+    # 多波段底图的通道用 底图名_通道 表示, 如 rgb_r/rgb_g/rgb_b
+    # 字段名长度请勿大于5个字符
+    index_names = [
+        'ndvi',
+        # 'evi',
+        # 'rvi',
+        # 'gndvi',
+        # 'tvi',
+        # 'dvi',
+        # 'savi',
+        # 'ndwi',
+        # 'msavi',
+        # 'gcvi',
+        # 'rndvi',
+        # 'ndre',
+        # 'rri1',
+        # 'rri2',
+        # 'msrre',
+        # 'clre',
+        # 'ireci',
+        # 'lswi',
+        # 'exg',
+    ]
     
+    # 只加载指数公式用到的底图
+    bands = required_rasters(index_names)
+    tif_paths = [(name, path) for name, path in tif_paths if name in bands]
+
     try:
         # 初始化分析器
         analyzer = MultiRasterAnalyzer(shp_path, tif_paths)
@@ -45,102 +61,33 @@ def main():
         # 遍历所有区块计算植被指数和植被指数均匀度
         print("开始计算植被指数和植被指数均匀度...")
         results = []
-        for tile_id, tile_data in analyzer.iterate_tiles():
+        # 只提取区块内像素, 避免区块外的0值参与统计
+        for tile_id, tile_data in analyzer.iterate_tiles(mode='compact'):
             print(f"处理区块: {tile_id}")
 
-            red = tile_data['red']
-            nir = tile_data['nir']
-            # green = tile_data['green']
-            # rededge = tile_data['rededge']
-            # rgb_r = tile_data['rgb'][0,:,:]
-            # rgb_g = tile_data['rgb'][1,:,:]
-            # rgb_b = tile_data['rgb'][2,:,:]
-            # blue = tile_data['blue']
-            # hrgb = tile_data['hrgb']
-            # rededge1 = tile_data['rededge1']
-            # rededge2 = tile_data['rededge2']
-            # rededge3 = tile_data['rededge3']
-            # swir1 = tile_data['swir1']
-            # swir2 = tile_data['swir2']
-            # 字段名长度请勿大于10个字符
-
-
-            # 计算植被指数
-            with np.errstate(divide='ignore', invalid='ignore'):
-                ndvi = (nir - red) / (nir + red)
-                # evi = 2.5 * (nir - red) / (nir + 6 * red - 7.5 * blue + 1)
-                # rvi = nir/red
-                # gndvi = (nir - green) / (nir + green)
-                # tvi = 60 * (nir - green) - 100 * (red - green)
-                # dvi = nir-red
-                # savi = (1 + 0.5) * (nir - red) / (nir + red + 0.5)
-                # ndwi = (green - nir) / (green + nir)
-                # msavi = (2 * nir + 1 - np.sqrt((2 * nir + 1) ** 2 - 8 * (nir - red))) / 2
-                # gcvi = (nir / green) - 1
-                # rndvi = (rededge1 - red) / (rededge1 + red)
-                # ndre = (nir - rededge1) / (nir + rededge1)
-                # rri1 = nir/rededge1
-                # rri2 = rededge1/nir
-                # msrre = (nir - rededge1 - 1) / (sqrt(nir - rededge1) + 1)
-                # clre = (nir / rededge1) - 1
-                # ireci = (rededge3 - red) / (rededge1 / rededge2)
-                # lswi = (nir - swir1) / (nir + swir1)
-                # exg = 2 * rgb_g - rgb_r - rgb_b
-                # 字段名长度请勿大于5个字符
-
-            indexs = {  'ndvi':ndvi,
-                        # 'evi':evi,
-                        # 'rvi':rvi,
-                        # 'gndvi':gndvi,
-                        # 'tvi':tvi,
-                        # 'dvi':dvi,
-                        # 'savi':savi,
-                        # 'ndwi':ndwi,
-                        # 'msavi':msavi,
-                        # 'gcvi':gcvi,
-                        # 'rndvi':rndvi,
-                        # 'ndre':ndre,
-                        # 'rri1':rri1,
-                        # 'rri2':rri2,
-                        # 'msrre':msrre,
-                        # 'clre':clre,
-                        # 'ireci':ireci,
-                        # 'lswi':lswi,
-                        # 'exg':exg,
-                    }
-
-            # 将NaN和无穷大值替换为合理值
-            for name, index in indexs.items():
-                indexs[name] = np.nan_to_num(index, nan=0.0, posinf=1.0, neginf=-1.0)
+            # 计算植被指数, 所需波段由公式自动确定, 多个指数共享相同的子表达式
+            # 并将NaN和无穷大值替换为合理值
+            indexs = evaluate_indices(tile_data, index_names, nan=0.0, posinf=1.0, neginf=-1.0)
 
             # 计算各项统计指标
-            index_mean = calculate_mean(indexs)          # 平均值
-            index_std = calculate_std(indexs)            # 标准差
-            index_mode = calculate_mode(indexs)          # 众数
-            index_var = calculate_variance(indexs)       # 方差
-            index_median = calculate_median(indexs)      # 中位数
-            index_iqr = calculate_iqr(indexs)            # 四分位距
-            index_range = calculate_range(indexs)        # 极差
-            index_skew = calculate_skewness(indexs)      # 偏度
-            index_kurt = calculate_kurtosis(indexs)      # 峰度
-            index_cov = calculate_coefficient_of_variation(indexs)  # 变异系数
-            index_uni = calculate_uniformity(indexs)     # 均匀度
-
+            index_stats = compute_all_stats(indexs, stats=[
+                'mean',     # 平均值
+                'std',      # 标准差
+                'mode',     # 众数
+                'var',      # 方差
+                'median',   # 中位数
+                'iqr',      # 四分位距
+                'range',    # 极差
+                'skew',     # 偏度
+                'kurt',     # 峰度
+                'cv',       # 变异系数
+                'uni',      # 均匀度
+            ])
 
             # 保存结果
             result = {
                 'FID': tile_id,
-                **index_mean,
-                **index_std,
-                **index_mode,
-                **index_var,
-                **index_median,
-                **index_iqr,
-                **index_range,
-                **index_skew,
-                **index_kurt,
-                **index_cov,
-                **index_uni,
+                **index_stats,
             }
             results.append(result)
         